@@ -27,3 +27,95 @@ MAX_THREAD_ARCHIVING_DURATION = 60 * 24 * 7 # should be 1h, 1 day, 3 days if boo
 
 USER_TIMEZONE = tz.gettz('Europe/Paris')
 
+# Minimum delay between two writes of a poll's data message (in seconds). Votes received
+# in the meantime are only kept in memory, and written all at once.
+POLL_DATA_FLUSH_INTERVAL = 5
+
+# Maximum number of messages of the tracking channel read at startup to index its threads.
+TRACKING_INDEX_SCAN_LIMIT = 200
+
+# Maximum number of characters of a Discord message.
+MAX_MESSAGE_LENGTH = 2000
+
+# Maximum number of actions sent to Discord at the same time by the outbound queue.
+OUTBOUND_CONCURRENCY = 4
+# Delay before retrying an action that got rate limited (in seconds), and maximum number of retries.
+OUTBOUND_RATE_LIMIT_BACKOFF = 5
+OUTBOUND_MAX_RETRIES = 3
+
+# File where the bot's metrics are written, in the Prometheus text format, and interval between two writes (in seconds).
+METRICS_FILE_PATH = 'metrics.prom'
+METRICS_WRITE_INTERVAL = 60
+
+# Local SQLite file where the bot's state is saved, None to only save it on Discord.
+STATE_DB_PATH = 'bot_state.sqlite3'
+# Whether to also save the state in the state message of the config channel. It is read
+# at startup when the local file doesn't exist (ex: the host's file system was reset).
+STATE_DISCORD_MIRROR = True
+# Delay (in seconds) during which the state saves requested are grouped into a single write.
+STATE_SAVE_DELAY = 2
+# Maximum number of routines executed at the same time.
+ROUTINES_CONCURRENCY = 3
+# Number of weeks of training dates formatted in advance, ie. a season.
+TRAINING_CALENDAR_WEEKS = 40
+# Cogs loaded only after the bot is ready, since the polls don't depend on them. They must not
+# define application commands: those are synced with Discord on connection, before the bot is
+# ready, which would delete the commands of the cogs not loaded yet.
+DEFERRED_COGS = ['monitoring']
+# Whether to request all the guild members at startup. The bot becomes ready only once
+# they're received, whereas the members it needs can be fetched on first use.
+CHUNK_GUILDS_AT_STARTUP = False
+# Whether to keep the threads from being archived, by resetting their archiving timer.
+ARCHIVING_SWEEP_ENABLED = False
+# Interval between two sweeps of the threads to keep from being archived (in seconds).
+ARCHIVING_SWEEP_INTERVAL = 3600
+# Time before being archived from which a thread's archiving timer is reset (in seconds).
+# Must be longer than the sweeps interval, for the threads to be reset in time.
+ARCHIVING_RESET_MARGIN = 6 * 3600
+# Maximum number of threads reset by a sweep, the others being reset by the next ones.
+ARCHIVING_SWEEP_BATCH = 50
+# Maximum number of threads reset at the same time.
+ARCHIVING_SWEEP_CONCURRENCY = 2
+# Maximum age of the messages Discord can delete in bulk (in seconds), ie. 2 weeks.
+BULK_DELETE_MAX_AGE = 14 * 24 * 3600
+# Maximum number of messages deleted in a bulk.
+BULK_DELETE_MAX_COUNT = 100
+# Maximum number of deletions made at the same time when purging a channel.
+PURGE_CONCURRENCY = 4
+# Interval between two updates of the purge's progress message (in seconds).
+PURGE_PROGRESS_INTERVAL = 3
+# Maximum number of reactions added or checked at the same time when copying a message's reactions.
+REACTIONS_CONCURRENCY = 3
+# Name of the club whose channels are the ones above. Its state sections keep their names,
+# whereas the other clubs' ones are prefixed with the club's name.
+DEFAULT_CLUB_NAME = 'default'
+# Whether to run the bot with automatic sharding, when serving many guilds.
+AUTO_SHARDING = False
+# Local queue where the gateway process pushes the poll events for the workers, in the split mode.
+EVENT_QUEUE_PATH = 'events.sqlite3'
+# Number of worker processes handling the poll events, in the split mode.
+WORKER_COUNT = 2
+# Interval at which a worker checks for new events when it has none (in seconds).
+EVENT_QUEUE_POLL_INTERVAL = 0.05
+# Maximum number of events a worker handles at the same time.
+EVENT_QUEUE_BATCH = 100
+# Time a process waits for the others to release the event queue's database (in milliseconds).
+EVENT_QUEUE_BUSY_TIMEOUT = 5000
+# Maximum number of members kept once fetched, when missing from the gateway cache.
+MEMBER_CACHE_SIZE = 1000
+# Time after which a fetched member is fetched again (in seconds).
+MEMBER_CACHE_TTL = 3600
+# Maximum number of members in a poll data message, for it to stay under MAX_MESSAGE_LENGTH.
+POLL_DATA_IDS_PER_MESSAGE = 130
+# Number of messages scanned at the start of a tracking thread to find its poll data messages,
+# when they aren't pinned.
+POLL_DATA_SCAN_LIMIT = 50
+# Whether to log the votes in digest messages, with a summary message edited after the votes,
+# rather than with two messages per vote.
+VOTE_LOG_DIGEST = True
+# Minimum delay between two digests of a poll's votes (in seconds).
+VOTE_LOG_FLUSH_INTERVAL = 10
+# Maximum number of consecutive retries of a poll data write failing with a transient error.
+POLL_DATA_WRITE_RETRIES = 5
+# Minimum import time of a module to be reported in the startup profile (in seconds).
+STARTUP_IMPORT_MIN_DURATION = 0.002
@@ -0,0 +1,90 @@
+import asyncio
+import datetime
+
+import discord
+import constants as CST
+import outbound
+
+
+# Keeps the threads from being archived, by resetting their archiving timer shortly
+# before it expires. Each sweep only resets the threads expiring within the margin,
+# the soonest first and at most a batch of them, the others being left to the next
+# sweeps. The resets go through the outbound queue at low priority.
+class ArchivingSweeper:
+
+    def __init__(self, bot, interval=CST.ARCHIVING_SWEEP_INTERVAL, margin=CST.ARCHIVING_RESET_MARGIN,
+                 batchSize=CST.ARCHIVING_SWEEP_BATCH, concurrency=CST.ARCHIVING_SWEEP_CONCURRENCY):
+        self.bot = bot
+        self.interval = interval
+        self.margin = datetime.timedelta(seconds=margin)
+        self.batchSize = batchSize
+        # Maximum number of threads reset at the same time, leaving
+        # the other workers of the outbound queue to the other actions.
+        self.concurrency = concurrency
+        self.task = None
+        # Counts of the last sweep.
+        self.lastReport = {'processed': 0, 'skipped': 0, 'postponed': 0, 'failed': 0}
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = self.bot.loop.create_task(self.__sweep_regularly())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def __sweep_regularly(self):
+        while not self.bot.is_closed():
+            await self.sweep()
+            await asyncio.sleep(min(self.interval, CST.MAX_SLEEP_DURATION))
+
+    # Reset the archiving timer of the threads close to be archived, and get the counts of the
+    # threads processed, skipped (not close to be archived), postponed and whose reset failed.
+    async def sweep(self):
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        dueThreads = []
+        skippedCount = 0
+        for thread in self.get_threads():
+            expiry = thread.archive_timestamp + datetime.timedelta(minutes=thread.auto_archive_duration)
+            if expiry - now <= self.margin:
+                dueThreads.append((expiry, thread))
+            else:
+                skippedCount += 1
+        dueThreads.sort(key=lambda dueThread: dueThread[0])
+        batch = [thread for expiry, thread in dueThreads[:self.batchSize]]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*[self.reset(thread, semaphore) for thread in batch])
+        failedCount = results.count(False)
+        self.lastReport = {'processed': len(batch) - failedCount, 'skipped': skippedCount,
+                           'postponed': len(dueThreads) - len(batch), 'failed': failedCount}
+        self.log(", ".join(f"{count} {name}" for name, count in self.lastReport.items()))
+        return self.lastReport
+
+    # Threads that may be archived: the active ones of the text channels, except those
+    # archived after an hour, which are left to be archived.
+    def get_threads(self):
+        for guild in self.bot.guilds:
+            for channel in guild.channels:
+                if channel.type.name == 'text':
+                    for thread in channel.threads:
+                        if thread.auto_archive_duration != 60 and not thread.archived:
+                            yield thread
+
+    async def reset(self, thread, semaphore):
+        async with semaphore:
+            route = ('edit_channel', thread.id)
+            try:
+                # Changing the archiving duration back and forth restarts the timer.
+                await self.bot.outbound.submit(thread.edit, auto_archive_duration=60,
+                                               priority=outbound.LOW, route=route)
+                await self.bot.outbound.submit(thread.edit, auto_archive_duration=CST.MAX_THREAD_ARCHIVING_DURATION,
+                                               priority=outbound.LOW, route=route)
+                return True
+            except discord.HTTPException as e:
+                self.log(f"couldn't reset the archiving timer of {thread.name}: {e}")
+                return False
+
+    def log(self, msg):
+        print(f"[archiving sweeper] {msg}")
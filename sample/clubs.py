@@ -0,0 +1,122 @@
+import datetime
+
+import constants as CST
+from poll import PollStore, TrackingDirectory, VoteLog
+
+
+# Configuration and state of a club, ie. of a guild served by the bot: its channels,
+# routines, canceled trainings and polls' data, kept apart from the other clubs' ones.
+class Club:
+
+    def __init__(self, bot, name, trainingPollsChannelId, trackingChannelId, testChannelId, guildId=None):
+        self.bot = bot
+        self.name = name
+        # Identifier of the club's guild. If None, found from its channels once the bot is ready.
+        self.guildId = guildId
+        self.trainingPollsChannelId = trainingPollsChannelId
+        self.trackingChannelId = trackingChannelId
+        self.testChannelId = testChannelId
+        self.routines = []
+        # dd/mm date -> reason
+        self.canceledTrainings = {}
+        # Time of the club's polls, unless a routine has its own. By giving no argument, this will be midnight.
+        self.routinesTriggerTime = datetime.time()
+        self.trackingDirectory = TrackingDirectory(bot, trackingChannelId)
+        self.pollStore = PollStore(bot, self.trackingDirectory)
+        self.voteLog = VoteLog(bot)
+
+    def add_routine(self, routine):
+        routine.club = self
+        self.routines.append(routine)
+        return self
+
+    # Set the time of the club's polls, and schedule its routines again. The other clubs' ones are left as is.
+    def set_routines_trigger_time(self, triggerTime):
+        self.routinesTriggerTime = triggerTime
+        for routine in self.routines:
+            self.bot.scheduler.schedule(routine)
+        return self
+
+    def get_next_trigger_date(self):
+        now = datetime.datetime.now(tz=CST.USER_TIMEZONE)
+        triggerDate = datetime.datetime.combine(now, self.routinesTriggerTime, tzinfo=CST.USER_TIMEZONE)
+        # If the trigger time has passed for today, consider tomorrow's trigger time.
+        if triggerDate < now:
+            triggerDate += datetime.timedelta(days=1)
+        return triggerDate
+
+    def get_time_until_routines_trigger(self):
+        return self.get_next_trigger_date() - datetime.datetime.now(tz=CST.USER_TIMEZONE)
+
+    def channel_ids(self):
+        return [self.trainingPollsChannelId, self.trackingChannelId, self.testChannelId]
+
+    # Prefix of the club's sections in the bot's state. The default club's
+    # sections have none, as they had before the bot served several clubs.
+    def get_state_prefix(self):
+        return "" if self.name == CST.DEFAULT_CLUB_NAME else f"{self.name}."
+
+    # Name of the club's own section in the bot's state.
+    def get_state_section(self):
+        return self.get_state_prefix() + 'club'
+
+    def log(self, msg):
+        print(f"[club {self.name}] {msg}")
+
+
+# Registry of the clubs served by the bot, indexed by guild and by channel,
+# so that each event is routed to its club with a dict lookup.
+class ClubRegistry:
+
+    def __init__(self):
+        # name -> club, in registration order
+        self.clubs = {}
+        self.clubsByGuild = {}
+        self.clubsByChannel = {}
+
+    def add(self, club):
+        if club.name in self.clubs:
+            raise ValueError(f"club {club.name} already registered")
+        self.clubs[club.name] = club
+        self.__index(club)
+        return club
+
+    def __index(self, club):
+        if club.guildId is not None:
+            self.clubsByGuild[club.guildId] = club
+        for channelId in club.channel_ids():
+            self.clubsByChannel[channelId] = club
+
+    # Find the guild of the clubs registered without one, from their channels.
+    def resolve_guilds(self, bot):
+        for club in self.clubs.values():
+            if club.guildId is None:
+                channel = bot.get_channel(club.trainingPollsChannelId)
+                if channel is None:
+                    club.log("couldn't find its guild")
+                else:
+                    club.guildId = channel.guild.id
+                    self.__index(club)
+
+    def get(self, name):
+        return self.clubs.get(name)
+
+    def default(self):
+        return self.clubs.get(CST.DEFAULT_CLUB_NAME)
+
+    # Get the club of the given guild, None if the guild has none.
+    def for_guild(self, guildId):
+        return self.clubsByGuild.get(guildId)
+
+    # Get the club owning the given channel, None if no club does.
+    def for_channel(self, channelId):
+        return self.clubsByChannel.get(channelId)
+
+    def routines(self):
+        return [routine for club in self.clubs.values() for routine in club.routines]
+
+    def __iter__(self):
+        return iter(self.clubs.values())
+
+    def __len__(self):
+        return len(self.clubs)
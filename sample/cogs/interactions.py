@@ -5,6 +5,7 @@ from discord.ext import commands
 from discord.commands import Option, SlashCommandGroup
 
 import constants as CST
+from purge import ChannelPurge
 
 
 class Interactions(commands.Cog):
@@ -53,12 +54,7 @@ class Interactions(commands.Cog):
         else:
             msg = await ctx.fetch_message(msg_id)
 
-        for reaction in msg.reactions:
-            await msg.add_reaction(reaction.emoji)
-            # remove the reactions made by the author of the message
-            async for user in reaction.users():
-                if user == ctx.author:
-                    await msg.remove_reaction(reaction.emoji, user)
+        await copy_reactions(msg, ctx.author)
         await ctx.delete()
 
     # @commands.slash_command(name='clean_test_channel', description="Clear everything in the test channel")
@@ -127,12 +123,7 @@ class Interactions(commands.Cog):
             await warning.delete()
         else:
             msg = await ctx.fetch_message(ctx.message.reference.resolved.id)
-            for reaction in msg.reactions:
-                await msg.add_reaction(reaction.emoji)
-                # remove the reactions made by the author of the message
-                async for user in reaction.users():
-                    if user == ctx.message.author:
-                        await msg.remove_reaction(reaction.emoji, user)
+            await copy_reactions(msg, ctx.message.author)
 
         await ctx.message.delete()
         # async for message in ctx.channel.history(author=ctx.guild.get_member(913556318768463893)):
@@ -244,11 +235,20 @@ class Interactions(commands.Cog):
 
     @commands.command(name='clear', brief="Clear everything in the test channel")
     async def clean_test_channel(self, ctx: commands.Context):
-        # respond = await ctx.respond("working...")
-        for thread in ctx.bot.get_channel(CST.TEST_CHANNEL_ID).threads:
-            await thread.delete()
-        for msg in await ctx.bot.get_channel(CST.TEST_CHANNEL_ID).history().flatten():
-            await msg.delete()
+        club = None if ctx.guild is None else ctx.bot.clubs.for_guild(ctx.guild.id)
+        if club is None:
+            await ctx.send("This server has no club.")
+            return
+        progressMsg = await ctx.send("clearing the test channel...")
+        purge = ChannelPurge(ctx.bot.get_channel(club.testChannelId), keptIds=[progressMsg.id])
+        purgeTask = asyncio.ensure_future(purge.run())
+        # Report the progress until the purge is done.
+        while not purgeTask.done():
+            await asyncio.wait([purgeTask], timeout=CST.PURGE_PROGRESS_INTERVAL)
+            if not purgeTask.done():
+                await progressMsg.edit(content=f"clearing the test channel: {purge.report()}...")
+        await purgeTask
+        await progressMsg.edit(content=f"test channel cleared: {purge.report()}")
 
     @commands.command(name='embed_from_dict', brief="Create an embed from a python dictionary. Need to respond to a "
                                                     "message")
@@ -301,5 +301,32 @@ class Interactions(commands.Cog):
                 await ctx.send(embeddict)
 
 
+# Add the bot's reaction to each reaction of the given message, and remove the given member's ones.
+async def copy_reactions(msg, member):
+    semaphore = asyncio.Semaphore(CST.REACTIONS_CONCURRENCY)
+
+    async def add_reaction(reaction):
+        async with semaphore:
+            await msg.add_reaction(reaction.emoji)
+
+    async def remove_member_reaction(reaction, otherUserCount):
+        if otherUserCount == 0:
+            return
+        async with semaphore:
+            # The users are listed by id, so only the first one after the member's id
+            # before needs to be requested, whatever the number of users who reacted.
+            async for user in reaction.users(limit=1, after=discord.Object(id=member.id - 1)):
+                if user.id == member.id:
+                    await msg.remove_reaction(reaction.emoji, member)
+
+    # Counted before the bot's reactions are added.
+    otherUserCounts = [reaction.count - (1 if reaction.me else 0) for reaction in msg.reactions]
+    # The reactions keep their order, since they're all on the message already.
+    await asyncio.gather(*[add_reaction(reaction) for reaction in msg.reactions if not reaction.me])
+    # Removed only once the bot's reactions are added, for the emojis to stay on the message.
+    await asyncio.gather(*[remove_member_reaction(reaction, otherUserCount)
+                           for reaction, otherUserCount in zip(msg.reactions, otherUserCounts)])
+
+
 def setup(bot):
     bot.add_cog(Interactions(bot))
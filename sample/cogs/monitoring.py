@@ -0,0 +1,22 @@
+from discord.ext import commands
+
+import constants as CST
+
+
+class Monitoring(commands.Cog):
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.command(brief="report the latency of the handlers and the API calls made")
+    async def metrics(self, ctx: commands.Context):
+        summary = ctx.bot.metrics.summary()
+        # Keep room for the code block markers.
+        maxLength = CST.MAX_MESSAGE_LENGTH - 8
+        if len(summary) > maxLength:
+            summary = summary[:maxLength - 1] + "…"
+        await ctx.send(f"```\n{summary}\n```")
+
+
+def setup(bot):
+    bot.add_cog(Monitoring(bot))
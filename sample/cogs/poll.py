@@ -13,17 +13,38 @@ class Poll(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    # The commands only apply in the guilds of the clubs.
+    async def cog_check(self, ctx):
+        return get_club(ctx) is not None
+
     @commands.command(brief="set the poll committing time")
     async def set_poll_time(self, ctx: commands.Context, hoursStr, minutesStr=None, secondsStr=None):
         hours = int(hoursStr)
         minutes = 0 if minutesStr is None else int(minutesStr)
         seconds = 0 if secondsStr is None else int(secondsStr)
         triggerTime = datetime.time(hour=hours, minute=minutes, second=seconds)
-        await ctx.bot.set_routines_trigger_time(triggerTime)
+        # Only the polls of the guild's club are moved.
+        get_club(ctx).set_routines_trigger_time(triggerTime)
         await ctx.bot.save_state()
         # await ctx.respond(f"Polls sending time set to {triggerTime}.")
         await ctx.send(f"Polls sending time set to {triggerTime}.")
 
+    @commands.command(brief="set the given poll's committing time, or reset it to the polls' one")
+    async def set_routine_time(self, ctx: commands.Context, trainingDayName, hoursStr=None, minutesStr=None,
+                               secondsStr=None):
+        triggerTime = None if hoursStr is None else \
+            datetime.time(hour=int(hoursStr), minute=0 if minutesStr is None else int(minutesStr),
+                          second=0 if secondsStr is None else int(secondsStr))
+
+        for routine in get_club(ctx).routines:
+            if routine.cmdKeyWord == trainingDayName:
+                routine.set_trigger_time(triggerTime)
+                await ctx.send(f'"{routine.displayName}" sending time set to {routine.get_trigger_time()}.')
+                await ctx.bot.save_state()
+                return
+
+        await ctx.send("The name provided for the training day is unknown.")
+
     """Starts one message vote for lundi, mercredi or samedi.
     Enter the loop to start: lu, me or sa, and the day to send the vote """
 
@@ -42,10 +63,11 @@ class Poll(commands.Cog):
 
         executionDayNum = dayNameNums[executionDayName]
         asTest = False if asTestStr is None else (asTestStr.lower() == "test")
-        channelId = CST.TEST_CHANNEL_ID if asTest else CST.TRAINING_POLLS_CHANNEL_ID
+        club = get_club(ctx)
+        channelId = club.testChannelId if asTest else club.trainingPollsChannelId
         asTestMsg = " for testing" if asTest else ""
 
-        for routine in ctx.bot.routines:
+        for routine in club.routines:
             if routine.cmdKeyWord == trainingDayName:
                 routine.enable(executionDayNum, channelId)
                 await ctx.send(
@@ -65,7 +87,7 @@ class Poll(commands.Cog):
             await ctx.send("The name provided for the training day is unknown.")
             return
 
-        for routine in ctx.bot.routines:
+        for routine in get_club(ctx).routines:
             if routine.cmdKeyWord == trainingDayName:
                 foundRoutine = True
                 print(foundRoutine)
@@ -76,31 +98,41 @@ class Poll(commands.Cog):
 
     @commands.command(brief="return some info about the polls")
     async def status(self, ctx: commands.Context):
-        triggerTimeStr = ctx.bot.routinesTriggerTime.strftime("%H:%M:%S")
-        timeUntilTriggerStr = poll.format_time_delta(ctx.bot.get_time_until_routines_trigger())
+        club = get_club(ctx)
+        triggerTimeStr = club.routinesTriggerTime.strftime("%H:%M:%S")
+        timeUntilTriggerStr = poll.format_time_delta(club.get_time_until_routines_trigger())
         lastRoutinesTriggerDateStr = poll.format_datetime(ctx.bot.lastRoutinesTriggerDate)
 
-        msg = f'Start time: {poll.format_datetime(ctx.bot.routinesTaskStartTime)}\n' \
+        msg = f'Start time: {poll.format_datetime(ctx.bot.scheduler.startTime)}\n' \
               f'Poll time: {triggerTimeStr} ({timeUntilTriggerStr} before next trigger)\n' \
               f'Last routines trigger: {lastRoutinesTriggerDateStr}\n'
 
-        for routine in ctx.bot.routines:
+        for routine in club.routines:
             if routine.isEnabled:
-                isForTesting = 'yes' if routine.channelId == CST.TEST_CHANNEL_ID else 'no'
+                isForTesting = 'yes' if routine.channelId == club.testChannelId else 'no'
                 msg += f'Routine "{routine.displayName}" enabled:\n' \
-                       f'\t- execution day: {poll.format_weekday_num(routine.executionDayNum)}\n' \
+                       f'\t- execution day: {poll.format_weekday_num(routine.executionDayNum)}' \
+                       f' at {routine.get_trigger_time()}\n' \
                        f'\t- last execution: {poll.format_datetime(routine.lastExecutionDate)}\n' \
                        f'\t- for testing: {isForTesting}\n'
             else:
                 msg += f'Routine "{routine.displayName}" disabled\n'
 
+        now = datetime.datetime.now(tz=CST.USER_TIMEZONE)
+        msg += 'Upcoming executions:\n'
+        for deadline, routine in ctx.bot.scheduler.upcoming():
+            if routine.club is not club:
+                continue
+            msg += f'\t- {poll.format_datetime(deadline)}: "{routine.displayName}"' \
+                   f' (in {poll.format_time_delta(deadline - now)})\n'
+
         await ctx.send(msg)
 
     @commands.command(brief="add a training to cancel")
     async def canceled_training(self, ctx: commands.Context, date, reason):
 
         if date.replace('/', '').isdigit():
-            ctx.bot.canceledTrainings[date] = reason
+            get_club(ctx).canceledTrainings[date] = reason
             response = await ctx.send(f"l'entraitnement du {date} est enregistré comme annulé car {reason}")
         else:
             response = await ctx.send("le format de date entré est incorrect (dd/mm)")
@@ -113,7 +145,7 @@ class Poll(commands.Cog):
     async def remove_canceled_training(self, ctx: commands.Context, date):
 
         if date.replace('/', '').isdigit():
-            del ctx.bot.canceledTrainings[date]
+            del get_club(ctx).canceledTrainings[date]
             response = await ctx.send(f"l'entraitnement du {date} a été retiré")
         else:
             response = await ctx.send("le format de date entré est incorrect (dd/mm)")
@@ -135,8 +167,12 @@ async def _add_canceled_date(ctx: discord.ApplicationContext,
                              reason: Option(str,
                                             description="entraînement annulé car:",
                                             required=True)):
+    club = get_club(ctx)
+    if club is None:
+        await ctx.respond("This server has no club.")
+        return
     if date.replace('/', '').isdigit() and len(date) == 5:
-        ctx.bot.canceledTrainings[date] = reason
+        club.canceledTrainings[date] = reason
         response = await ctx.respond(f"l'entrainement du {date} est enregistré comme annulé car {reason}")
     else:
         response = await ctx.respond("le format de date entré est incorrect (dd/mm)")
@@ -149,9 +185,13 @@ async def _remove_canceled_date(ctx: discord.ApplicationContext,
                                     date: Option(str,
                                                  description="date (format dd/mm)",
                                                  required=True)):
+    club = get_club(ctx)
+    if club is None:
+        await ctx.respond("This server has no club.")
+        return
     if date.replace('/', '').isdigit() and len(date) == 5:
-        if ctx.bot.canceledTrainings.get(date) is not None:
-            del ctx.bot.canceledTrainings[date]
+        if club.canceledTrainings.get(date) is not None:
+            del club.canceledTrainings[date]
             response = await ctx.respond(f"l'entrainement du {date} a été retiré")
         else:
             response = await ctx.respond(f"l'entrainement du {date} n'est pas dans la liste")
@@ -160,6 +200,11 @@ async def _remove_canceled_date(ctx: discord.ApplicationContext,
     await ctx.bot.save_state()
 
 
+# Get the club of the guild where the command was sent, None if there's none.
+def get_club(ctx):
+    return None if ctx.guild is None else ctx.bot.clubs.for_guild(ctx.guild.id)
+
+
 def setup(bot):
     bot.add_cog(Poll(bot))
     bot.add_application_command(training_commands_group)
@@ -0,0 +1,87 @@
+import asyncio
+import contextlib
+
+
+# Coalesces concurrent calls made with the same key: while a call is in flight,
+# the following callers wait for its result instead of doing the same work again.
+class SingleFlight:
+
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key, coroFunc, *args):
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coroFunc(*args))
+            self.calls[key] = task
+            task.add_done_callback(lambda t: self.__forget(key, t))
+        # Shielded, so that a cancelled caller doesn't cancel the call shared with the others.
+        return await asyncio.shield(task)
+
+    def __forget(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+
+
+# Async locks created on demand, one per key, used as "async with locks(key)". A lock is
+# dropped once no task holds or waits for it, so that the keys don't pile up.
+class KeyedLocks:
+
+    def __init__(self):
+        # key -> [lock, number of tasks holding or waiting for it]
+        self.locks = {}
+
+    # The lock is requested without suspending the task before, so that the tasks
+    # requesting it get it in the order they were started.
+    @contextlib.asynccontextmanager
+    async def __call__(self, key):
+        entry = self.locks.get(key)
+        if entry is None:
+            entry = self.locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.locks[key]
+
+
+# Runs a coroutine function once after a delay, however many times it was scheduled in
+# between, so that a burst of changes is persisted (or sent) in a single run. Changes made
+# during a run are handled by the next one. The runs never overlap.
+class DebouncedFlush:
+
+    def __init__(self, coroFunc):
+        self.coroFunc = coroFunc
+        # timer of the pending run, and task of the last run started
+        self.timer = None
+        self.task = None
+
+    # Run the function with the given arguments after the given delay (in seconds),
+    # unless a run is already pending.
+    def schedule(self, delay, *args):
+        if self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(delay, self.__start, args)
+
+    def __start(self, args):
+        self.timer = None
+        self.task = asyncio.get_running_loop().create_task(self.__run(self.task, args))
+        return self.task
+
+    async def __run(self, previousTask, args):
+        if previousTask is not None:
+            await asyncio.wait([previousTask])
+        await self.coroFunc(*args)
+
+    # Run the function right away, instead of the pending run if any, for ex. before shutting
+    # the bot down: once the run in progress is over, and again as long as runs get scheduled
+    # meanwhile (ex: retries of failed writes), so that nothing is left pending.
+    async def flush(self, *args):
+        while True:
+            if self.timer is not None:
+                self.timer.cancel()
+            await self.__start(args)
+            if self.timer is None:
+                return
@@ -0,0 +1,115 @@
+import asyncio
+import concurrent.futures
+import json
+import sqlite3
+import zlib
+
+import constants as CST
+
+
+# Local queue of the gateway events handled by the worker processes: a SQLite database
+# in WAL mode, shared by the gateway process that pushes the events and the workers
+# that fetch them. Events are spread over partitions by key (ex: the poll message id),
+# each partition being handled by a single worker, in the order the events were pushed.
+# The writes (pushes and acks) are made in a thread of their own, so that waiting for the
+# database's lock held by another process never blocks the event loop, and so the gateway's
+# heartbeat. The reads don't need to: in WAL mode, readers don't wait for the writers.
+class SqliteEventQueue:
+
+    def __init__(self, path=CST.EVENT_QUEUE_PATH, partitionCount=CST.WORKER_COUNT):
+        self.path = path
+        self.partitionCount = partitionCount
+        # connection used for the reads, in the event loop's thread
+        self.connection = None
+        # Thread making the writes, a single one so that they're made in the order they
+        # were requested, and its connection, only used from it.
+        self.writer = None
+        self.writeConnection = None
+        # metrics
+        self.pushedCount = 0
+        self.ackedCount = 0
+
+    def __open(self):
+        # Autocommit: each push and ack is a transaction of its own.
+        connection = sqlite3.connect(self.path, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        # The gateway and the workers write to the same database.
+        connection.execute(f"PRAGMA busy_timeout={CST.EVENT_QUEUE_BUSY_TIMEOUT}")
+        connection.execute("CREATE TABLE IF NOT EXISTS events ("
+                           "id INTEGER PRIMARY KEY AUTOINCREMENT, partition INTEGER NOT NULL, "
+                           "kind TEXT NOT NULL, payload TEXT NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS events_partition ON events (partition, id)")
+        return connection
+
+    def __connect(self):
+        if self.connection is None:
+            self.connection = self.__open()
+        return self.connection
+
+    # Run the given function in the writer thread.
+    async def __write(self, func, *args):
+        if self.writer is None:
+            self.writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='event-queue')
+        return await asyncio.get_running_loop().run_in_executor(self.writer, func, *args)
+
+    # In the writer thread.
+    def __connect_writer(self):
+        if self.writeConnection is None:
+            self.writeConnection = self.__open()
+        return self.writeConnection
+
+    # Partition of the events with the given key, the same in every process.
+    def partition_of(self, key):
+        return zlib.crc32(str(key).encode()) % self.partitionCount
+
+    # The events are pushed in the order this is called.
+    async def push(self, kind, payload, key):
+        await self.__write(self.__insert, [(self.partition_of(key), kind, json.dumps(payload))])
+        self.pushedCount += 1
+
+    # Push an event to be handled by every worker.
+    async def push_all(self, kind, payload):
+        await self.__write(self.__insert, [(partition, kind, json.dumps(payload))
+                                           for partition in range(self.partitionCount)])
+        self.pushedCount += self.partitionCount
+
+    def __insert(self, rows):
+        with self.__connect_writer() as connection:  # in a single transaction
+            connection.execute("BEGIN")
+            connection.executemany("INSERT INTO events (partition, kind, payload) VALUES (?, ?, ?)", rows)
+
+    # Get the events of the given partition pushed after the given one, as [(id, kind, payload)].
+    def fetch(self, partition, afterId=0, limit=CST.EVENT_QUEUE_BATCH):
+        rows = self.__connect().execute("SELECT id, kind, payload FROM events WHERE partition = ? AND id > ? "
+                                        "ORDER BY id LIMIT ?", (partition, afterId, limit)).fetchall()
+        return [(eventId, kind, json.loads(payload)) for eventId, kind, payload in rows]
+
+    # Remove a handled event. Events not acknowledged are fetched again when the worker restarts.
+    async def ack(self, eventId):
+        await self.__write(self.__delete, eventId)
+        self.ackedCount += 1
+
+    def __delete(self, eventId):
+        self.__connect_writer().execute("DELETE FROM events WHERE id = ?", (eventId,))
+
+    def depth(self):
+        return self.__connect().execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def stats(self):
+        return {'pushed': self.pushedCount, 'acked': self.ackedCount, 'depth': self.depth()}
+
+    # Close the connections, once the writes requested are made.
+    async def close(self):
+        if self.writer is not None:
+            await self.__write(self.__close_writer)
+            self.writer.shutdown()
+            self.writer = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __close_writer(self):
+        if self.writeConnection is not None:
+            self.writeConnection.close()
+            self.writeConnection = None
@@ -3,69 +3,115 @@
 # if any('SPYDER' in name for name in os.environ):
 #     import nest_asyncio
 #     nest_asyncio.apply()
-import theBot
-import poll
+from startupProfile import StartupProfile
+startupProfile = StartupProfile()
+with startupProfile.imports():
+    import theBot
+    import poll
 import os
+import subprocess
+import sys
 import constants as CST
 
-bot = theBot.TheBot()
-
-## --- sondages ---
-embedDescription = "Les entraînement auront toujours lieu 🤗\n" \
-                   "mais préviens quand même si tu viens (✅)\n" \
-                   "ça pourra être utile aux coachs \n" \
-                   "et tu rejoindras aussi le fil de l'entraînement\n"\
-                    "(tu peux annuler ta présence avec ❌ )"
-reactions = ["✅", "❌"]
-# embedDescriptionPoll = "Préviens de ta présence à l'entraînement : \n" \
-#                    "✅ si tu viens\n" \
-#                    "☑️ que si on est assez pour des matchs\n" \
-#                    "❌ si tu viens pas\n" \
-#                    "❔ si tu sais pas encore"
-# reactionsPoll = ["✅", "☑", "❌", "❔"]
-
-## ---- sans sondages ---
-embedDescriptionNoPoll = "Fini les sondages ! \nLes entraînement auront toujours lieu 🤗 "
-reactionsNoPoll = []
-
-# embedDescriptionMondayPoll = "L'entraînement du lundi a toujours lieu, quelque soit le nombre d'inscrits, " \
-#                    "le vote est donc facultatif: \n" \
-#                    "✅ si tu viens\n" \
-#                    "❌ si tu viens pas"
-# reactionsMondayPoll = ["✅", "❌"]
-
-
-threadMsgStr = "**Utilise la mention @here** pour envoyer une notification à toute personne ayant confirmé sa présence à cet entraînement"
-# threadMsgStr = f"<@&{CST.LICENCIE_ROLE_ID}>\n**Fil de discussion dédié à cet entraînement**"
-
-# mondayPollRoutine = \
-#     poll.TrainingPollRoutine("monday_training_poll",
-#                              "Monday training poll", bot,
-#                              poll.TrainingPollMsgBuilder(0, embedDescriptionMondayPoll, reactionsMondayPoll, 0x31B404, threadMsgStr), "lu")
-
-mondayPollRoutine = \
-    poll.TrainingPollRoutine("monday_training_poll",
-                             "Monday training poll", bot,
-                             poll.TrainingPollMsgBuilder(0, embedDescription, reactions, 0x31B404, threadMsgStr), "lu")
-
-wednesdayPollRoutine = \
-    poll.TrainingPollRoutine("wednesday_training_poll",
-                             "Wednesday training poll", bot,
-                             poll.TrainingPollMsgBuilder(2, embedDescription, reactions, 0x2A3AFF, threadMsgStr), "me")
-
-saturdayPollRoutine = \
-    poll.TrainingPollRoutine("saturday_training_poll",
-                             "Saturday training poll", bot,
-                             poll.TrainingPollMsgBuilder(5, embedDescription, reactions, 0xFF5733, threadMsgStr), "sa")
-
-bot.add_routine(mondayPollRoutine)
-bot.add_routine(wednesdayPollRoutine)
-bot.add_routine(saturdayPollRoutine)
-
-bot.param.stateHeader = "#state#\n#sauvegarde de l'état du bot\n"  # will be written by the bot
-bot.param.configHeader = "#config#"  # will not be written by the bot
-
-bot.run(os.environ['BOT_TOKEN'])
+
+# Create the bot, with its routines.
+def create_bot(startupProfile=None):
+    bot = theBot.TheBot(startupProfile)
+
+    ## --- sondages ---
+    embedDescription = "Les entraînement auront toujours lieu 🤗\n" \
+                       "mais préviens quand même si tu viens (✅)\n" \
+                       "ça pourra être utile aux coachs \n" \
+                       "et tu rejoindras aussi le fil de l'entraînement\n"\
+                        "(tu peux annuler ta présence avec ❌ )"
+    reactions = ["✅", "❌"]
+    # embedDescriptionPoll = "Préviens de ta présence à l'entraînement : \n" \
+    #                    "✅ si tu viens\n" \
+    #                    "☑️ que si on est assez pour des matchs\n" \
+    #                    "❌ si tu viens pas\n" \
+    #                    "❔ si tu sais pas encore"
+    # reactionsPoll = ["✅", "☑", "❌", "❔"]
+
+    ## ---- sans sondages ---
+    embedDescriptionNoPoll = "Fini les sondages ! \nLes entraînement auront toujours lieu 🤗 "
+    reactionsNoPoll = []
+
+    # embedDescriptionMondayPoll = "L'entraînement du lundi a toujours lieu, quelque soit le nombre d'inscrits, " \
+    #                    "le vote est donc facultatif: \n" \
+    #                    "✅ si tu viens\n" \
+    #                    "❌ si tu viens pas"
+    # reactionsMondayPoll = ["✅", "❌"]
+
+
+    threadMsgStr = "**Utilise la mention @here** pour envoyer une notification à toute personne ayant confirmé sa présence à cet entraînement"
+    # threadMsgStr = f"<@&{CST.LICENCIE_ROLE_ID}>\n**Fil de discussion dédié à cet entraînement**"
+
+    # mondayPollRoutine = \
+    #     poll.TrainingPollRoutine("monday_training_poll",
+    #                              "Monday training poll", bot,
+    #                              poll.TrainingPollMsgBuilder(0, embedDescriptionMondayPoll, reactionsMondayPoll, 0x31B404, threadMsgStr), "lu")
+
+    mondayPollRoutine = \
+        poll.TrainingPollRoutine("monday_training_poll",
+                                 "Monday training poll", bot,
+                                 poll.TrainingPollMsgBuilder(0, embedDescription, reactions, 0x31B404, threadMsgStr), "lu")
+
+    wednesdayPollRoutine = \
+        poll.TrainingPollRoutine("wednesday_training_poll",
+                                 "Wednesday training poll", bot,
+                                 poll.TrainingPollMsgBuilder(2, embedDescription, reactions, 0x2A3AFF, threadMsgStr), "me")
+
+    saturdayPollRoutine = \
+        poll.TrainingPollRoutine("saturday_training_poll",
+                                 "Saturday training poll", bot,
+                                 poll.TrainingPollMsgBuilder(5, embedDescription, reactions, 0xFF5733, threadMsgStr), "sa")
+
+    bot.add_routine(mondayPollRoutine)
+    bot.add_routine(wednesdayPollRoutine)
+    bot.add_routine(saturdayPollRoutine)
+
+    # The routines above are the ones of the default club, whose channels are set in the constants.
+    # Other clubs are served by adding them with their own channels and routines, ex.:
+    # otherClub = clubs.Club(bot, "other_club", trainingPollsChannelId, trackingChannelId, testChannelId)
+    # bot.add_club(otherClub)
+    # bot.add_routine(poll.TrainingPollRoutine("other_club_monday_training_poll", ...), otherClub)
+
+    bot.param.stateHeader = "#state#\n#sauvegarde de l'état du bot\n"  # will be written by the bot
+    bot.param.configHeader = "#config#"  # will not be written by the bot
+    return bot
+
+
+# The bot runs in one of the following modes, set by the BOT_MODE environment variable:
+# - single (default): a single process receiving and handling all the events.
+# - gateway: the process connected to the gateway, which runs the commands and routines,
+#   and pushes the poll events onto the event queue.
+# - worker: a process handling the poll events of the partition WORKER_INDEX of the queue.
+# - split: the gateway, with CST.WORKER_COUNT worker subprocesses, all on this machine.
+mode = os.environ.get('BOT_MODE', 'single')
+token = os.environ['BOT_TOKEN']
+if mode == 'worker':
+    from worker import run_worker
+    run_worker(create_bot(startupProfile), token, int(os.environ['WORKER_INDEX']))
+elif mode in ('gateway', 'split'):
+    from eventQueue import SqliteEventQueue
+    workers = []
+    if mode == 'split':
+        workers = [subprocess.Popen([sys.executable, __file__],
+                                    env=dict(os.environ, BOT_MODE='worker', WORKER_INDEX=str(index)))
+                   for index in range(CST.WORKER_COUNT)]
+    bot = create_bot(startupProfile)
+    bot.eventQueue = SqliteEventQueue()
+    try:
+        bot.run(token)
+    finally:
+        # The workers handle the events left in the queue before exiting.
+        for workerProcess in workers:
+            workerProcess.terminate()
+        for workerProcess in workers:
+            workerProcess.wait()
+else:
+    create_bot(startupProfile).run(token)
+
 
 # def main():
 #     pass
@@ -0,0 +1,185 @@
+import asyncio
+import bisect
+import collections
+import contextlib
+import contextvars
+import functools
+import os
+import time
+
+import constants as CST
+
+# Name of the handler (event or command) being executed, to which the REST calls are attributed.
+currentHandler = contextvars.ContextVar('currentHandler', default='other')
+
+
+# Latency histogram with fixed buckets (in seconds), as Prometheus' ones.
+class Histogram:
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # Get an estimation of the given percentile, ie. the upper bound of its bucket.
+    def percentile(self, ratio):
+        rank = ratio * self.count
+        cumulated = 0
+        for bound, count in zip(self.BUCKETS, self.counts):
+            cumulated += count
+            if cumulated >= rank:
+                return bound
+        return self.BUCKETS[-1]
+
+
+# Lightweight instrumentation of the bot: latency histograms per event handler and per
+# command, REST calls per endpoint and per handler, and errors per handler.
+class Metrics:
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.latencies = collections.defaultdict(Histogram)
+        # (handler, endpoint) -> number of REST calls
+        self.restCalls = collections.Counter()
+        self.errors = collections.Counter()
+        self.startTime = time.time()
+        self.writeTask = None
+        # Each process writes its own file, in the split mode.
+        self.filePath = CST.METRICS_FILE_PATH
+
+    # Measure the duration of the enclosed code, and attribute the REST calls
+    # it makes to the given handler name.
+    @contextlib.contextmanager
+    def measure(self, name):
+        token = currentHandler.set(name)
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors[name] += 1
+            raise
+        finally:
+            self.latencies[name].observe(time.perf_counter() - start)
+            currentHandler.reset(token)
+
+    # Decorator measuring each call of the given coroutine function, under its name.
+    def timed(self, coroFunc):
+        @functools.wraps(coroFunc)
+        async def timedCoroFunc(*args, **kwargs):
+            with self.measure(coroFunc.__name__):
+                return await coroFunc(*args, **kwargs)
+        return timedCoroFunc
+
+    def count_error(self, name):
+        self.errors[name] += 1
+
+    # Count every request made by the given pycord HTTP client, per endpoint
+    # (ex: "PATCH /channels/{channel_id}/messages/{message_id}") and per handler.
+    def instrument_http(self, http):
+        request = http.request
+
+        async def countedRequest(route, **kwargs):
+            self.restCalls[(currentHandler.get(), f"{route.method} {route.path}")] += 1
+            return await request(route, **kwargs)
+
+        http.request = countedRequest
+
+    # Statistics of the bot's components, as {component: {stat: value}}.
+    def component_stats(self):
+        stats = {
+            'resolver': {f"{kind}_{stat}": value
+                         for kind, kindStats in self.bot.resolver.stats().items()
+                         for stat, value in kindStats.items()},
+            'outbound': self.bot.outbound.stats(),
+            'member_cache': self.bot.resolver.members.stats(),
+            'poll_store': {'polls': sum(len(club.pollStore.polls) for club in self.bot.clubs),
+                           'dirty_polls': sum(len(club.pollStore.dirtyPolls) for club in self.bot.clubs),
+                           'writes': sum(club.pollStore.writeCount for club in self.bot.clubs)},
+            'vote_log': {stat: sum(club.voteLog.stats()[stat] for club in self.bot.clubs)
+                         for stat in ('pending_votes', 'digests', 'summary_edits')},
+            'clubs': {'count': len(self.bot.clubs)},
+            'archiving_sweeper': self.bot.archivingSweeper.lastReport,
+            'startup': {'time_to_ready': self.bot.startupProfile.timeToReady or 0.0},
+        }
+        if self.bot.eventQueue is not None:
+            stats['event_queue'] = self.bot.eventQueue.stats()
+        if self.bot.pollWorker is not None:
+            stats['poll_worker'] = self.bot.pollWorker.stats()
+        return stats
+
+    # Human readable summary, for the metrics command.
+    def summary(self):
+        lines = [f"uptime: {int(time.time() - self.startTime)}s", "handler: count p50 p99 errors"]
+        for name, histogram in sorted(self.latencies.items()):
+            lines.append(f"  {name}: {histogram.count} {format_seconds(histogram.percentile(0.5))} "
+                         f"{format_seconds(histogram.percentile(0.99))} {self.errors[name]}")
+        restCallsPerEndpoint = collections.Counter()
+        for (handler, endpoint), count in self.restCalls.items():
+            restCallsPerEndpoint[endpoint] += count
+        lines.append(f"REST calls: {sum(restCallsPerEndpoint.values())}")
+        for endpoint, count in restCallsPerEndpoint.most_common(10):
+            lines.append(f"  {endpoint}: {count}")
+        for component, stats in self.component_stats().items():
+            lines.append(f"{component}: " + ", ".join(f"{stat}={format_value(value)}"
+                                                      for stat, value in stats.items()))
+        return "\n".join(lines)
+
+    # Metrics in the Prometheus text exposition format.
+    def prometheus_text(self):
+        lines = ["# HELP constantia_handler_duration_seconds Duration of the event handlers and commands.",
+                 "# TYPE constantia_handler_duration_seconds histogram"]
+        for name, histogram in sorted(self.latencies.items()):
+            cumulated = 0
+            for bound, count in zip(Histogram.BUCKETS, histogram.counts):
+                cumulated += count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f'constantia_handler_duration_seconds_bucket{{handler="{name}",le="{le}"}} {cumulated}')
+            lines.append(f'constantia_handler_duration_seconds_sum{{handler="{name}"}} {histogram.sum}')
+            lines.append(f'constantia_handler_duration_seconds_count{{handler="{name}"}} {histogram.count}')
+        lines += ["# HELP constantia_handler_errors_total Errors raised by the event handlers and commands.",
+                  "# TYPE constantia_handler_errors_total counter"]
+        for name, count in sorted(self.errors.items()):
+            lines.append(f'constantia_handler_errors_total{{handler="{name}"}} {count}')
+        lines += ["# HELP constantia_rest_calls_total REST calls made to Discord.",
+                  "# TYPE constantia_rest_calls_total counter"]
+        for (handler, endpoint), count in sorted(self.restCalls.items()):
+            lines.append(f'constantia_rest_calls_total{{handler="{handler}",endpoint="{endpoint}"}} {count}')
+        for component, stats in self.component_stats().items():
+            for stat, value in stats.items():
+                lines.append(f"constantia_{component}_{stat} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+    # Write the metrics file, replacing the previous one at once so that it's never read half written.
+    def write_file(self, path=None):
+        path = self.filePath if path is None else path
+        tmpPath = path + ".tmp"
+        with open(tmpPath, 'w') as file:
+            file.write(self.prometheus_text())
+        os.replace(tmpPath, path)
+
+    # Write the metrics file at regular intervals, until the bot is closed.
+    def start_writing(self, interval=CST.METRICS_WRITE_INTERVAL):
+        if self.writeTask is None:
+            self.writeTask = self.bot.loop.create_task(self.__write_regularly(interval))
+
+    async def __write_regularly(self, interval):
+        while not self.bot.is_closed():
+            await asyncio.sleep(interval)
+            try:
+                self.write_file()
+            except OSError as e:
+                print(f"[metrics] couldn't write the metrics file: {e}")
+
+
+def format_seconds(seconds):
+    return "inf" if seconds == float('inf') else f"{seconds * 1000:g}ms"
+
+
+def format_value(value):
+    return f"{value:.3g}" if isinstance(value, float) else str(value)
@@ -0,0 +1,211 @@
+import asyncio
+import collections
+import itertools
+import time
+
+import discord
+import constants as CST
+from metrics import currentHandler
+
+# Priorities of the outbound actions, the lowest value being executed first.
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+
+# An action waiting to be sent to Discord.
+class OutboundAction:
+
+    def __init__(self, coroFunc, args, kwargs, priority, route, key, future):
+        self.coroFunc = coroFunc
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        # Actions of the same route (ex: ('send_message', channel id)) share a Discord
+        # rate limit bucket, so they are executed one at a time, in submission order.
+        self.route = route
+        # Actions with the same key (ex: ('edit_message', message id)) are coalesced.
+        self.key = key
+        self.future = future
+        self.seq = None
+        self.enqueueTime = None
+        self.retries = 0
+        # Handler that submitted this action, to which its REST calls are attributed.
+        self.handler = currentHandler.get()
+
+
+# Central queue of the actions sent to Discord (sends, edits, deletions, reactions,
+# thread creations). It executes them by priority, with a bounded concurrency, at
+# most one at a time per route, and backs a route off when it gets rate limited.
+class OutboundQueue:
+
+    def __init__(self, bot, concurrency=CST.OUTBOUND_CONCURRENCY):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.queue = None
+        self.workers = []
+        # Set once closed, after which no action can be submitted.
+        self.closed = False
+        self.seqs = itertools.count()
+        # key -> action not started yet, to coalesce with
+        self.pendingActions = {}
+        self.busyRoutes = set()
+        # route -> actions waiting for the action in progress on this route
+        self.parkedActions = {}
+        # route -> time before which the route must not be used (after a 429)
+        self.routeBackoffs = {}
+        # metrics
+        self.inFlight = 0
+        self.executedCount = 0
+        self.coalescedCount = 0
+        self.failedCount = 0
+        self.waitTimes = collections.deque(maxlen=1000)
+
+    # Submit an action, executed as coroFunc(*args, **kwargs). The returned future gives
+    # its result, and can be ignored for fire-and-forget actions. If an action with the
+    # same key is still pending, it is superseded: only the latest one is executed,
+    # and both futures give its result.
+    def submit(self, coroFunc, *args, priority=NORMAL, route=None, key=None, **kwargs):
+        if self.closed:
+            raise RuntimeError(f"outbound queue closed, {coroFunc.__qualname__} not submitted")
+        self.__start()
+        if key is not None and key in self.pendingActions:
+            action = self.pendingActions[key]
+            action.coroFunc, action.args, action.kwargs = coroFunc, args, kwargs
+            self.coalescedCount += 1
+            if priority < action.priority:
+                # Enqueued again with the higher priority, the first entry will be skipped.
+                action.priority = priority
+                self.__enqueue(action)
+            return action.future
+
+        future = self.bot.loop.create_future()
+        # Avoid "exception never retrieved" warnings for fire-and-forget actions,
+        # failures are logged by the queue anyway.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        action = OutboundAction(coroFunc, args, kwargs, priority, route, key, future)
+        if key is not None:
+            self.pendingActions[key] = action
+        action.enqueueTime = time.perf_counter()
+        self.__enqueue(action)
+        return future
+
+    def __start(self):
+        if self.queue is None:
+            self.queue = asyncio.PriorityQueue()
+            self.workers = [self.bot.loop.create_task(self.__work()) for _ in range(self.concurrency)]
+
+    def __enqueue(self, action):
+        action.seq = next(self.seqs)
+        self.queue.put_nowait((action.priority, action.seq, action))
+
+    async def __work(self):
+        queue = self.queue
+        while True:
+            priority, seq, action = await queue.get()
+            try:
+                # Skip the entries of actions already done, or enqueued again.
+                if action.future.done() or seq != action.seq:
+                    continue
+                if action.route in self.busyRoutes:
+                    self.parkedActions.setdefault(action.route, collections.deque()).append(action)
+                    continue
+                await self.__execute(queue, action)
+            finally:
+                queue.task_done()
+
+    async def __execute(self, queue, action):
+        if action.key is not None and self.pendingActions.get(action.key) is action:
+            del self.pendingActions[action.key]
+        self.busyRoutes.add(action.route)
+        self.inFlight += 1
+        try:
+            self.waitTimes.append(time.perf_counter() - action.enqueueTime)
+            currentHandler.set(action.handler)
+            # Retried in place, the route being kept busy during the backoff, so that
+            # the following actions of the route are still executed after this one.
+            while True:
+                backoff = self.routeBackoffs.get(action.route, 0) - time.perf_counter()
+                if backoff > 0:
+                    await asyncio.sleep(backoff)
+                try:
+                    result = await action.coroFunc(*action.args, **action.kwargs)
+                except discord.HTTPException as e:
+                    if e.status == 429 and action.retries < CST.OUTBOUND_MAX_RETRIES:
+                        self.log(f"{action.route} rate limited, retrying in {CST.OUTBOUND_RATE_LIMIT_BACKOFF}s")
+                        self.routeBackoffs[action.route] = time.perf_counter() + CST.OUTBOUND_RATE_LIMIT_BACKOFF
+                        action.retries += 1
+                        continue
+                    self.__fail(action, e)
+                except asyncio.CancelledError:
+                    action.future.cancel()
+                    raise
+                except Exception as e:
+                    self.__fail(action, e)
+                else:
+                    self.executedCount += 1
+                    action.future.set_result(result)
+                break
+        finally:
+            self.inFlight -= 1
+            self.busyRoutes.discard(action.route)
+            parked = self.parkedActions.get(action.route)
+            if parked:
+                # Keeps its place among the actions of the same priority.
+                parkedAction = parked.popleft()
+                queue.put_nowait((parkedAction.priority, parkedAction.seq, parkedAction))
+            elif parked is not None:
+                del self.parkedActions[action.route]
+
+    def __fail(self, action, e):
+        self.failedCount += 1
+        self.log(f"{action.coroFunc.__qualname__} on {action.route} failed: {e!r}")
+        action.future.set_exception(e)
+
+    # Wait for the submitted actions to be done (within the given timeout, if any),
+    # then stop the workers. The actions left are cancelled.
+    async def close(self, timeout=10):
+        self.closed = True
+        if self.queue is None:
+            return
+        queue, workers = self.queue, self.workers
+        try:
+            await asyncio.wait_for(queue.join(), timeout)
+        except asyncio.TimeoutError:
+            self.log(f"closing with {queue.qsize()} actions left")
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        while not queue.empty():
+            queue.get_nowait()[2].future.cancel()
+        for parked in self.parkedActions.values():
+            for action in parked:
+                action.future.cancel()
+        self.parkedActions = {}
+        self.pendingActions = {}
+        self.busyRoutes = set()
+        self.queue = None
+        self.workers = []
+
+    def stats(self):
+        waitTimes = sorted(self.waitTimes)
+        return {
+            'depth': 0 if self.queue is None else self.queue.qsize(),
+            'in_flight': self.inFlight,
+            'executed': self.executedCount,
+            'coalesced': self.coalescedCount,
+            'failed': self.failedCount,
+            'wait_p50': percentile(waitTimes, 0.5),
+            'wait_p99': percentile(waitTimes, 0.99),
+            'wait_max': waitTimes[-1] if waitTimes else 0.0,
+        }
+
+    def log(self, msg):
+        print(f"[outbound] {msg}")
+
+
+# Get the given percentile of the given sorted values.
+def percentile(sortedValues, ratio):
+    if not sortedValues:
+        return 0.0
+    return sortedValues[min(len(sortedValues) - 1, int(ratio * len(sortedValues)))]
@@ -1,8 +1,12 @@
-import babel.dates
-import ast
+import asyncio
 import discord
 import datetime
 import constants as CST
+from concurrency import SingleFlight, KeyedLocks, DebouncedFlush
+from scheduler import get_next_date
+from trainingCalendar import TrainingCalendar, get_weekday_name
+import outbound
+import pollDataFormat
 
 
 # Builder of an embed that will serve as a poll for a given training.
@@ -16,25 +20,32 @@ class TrainingPollMsgBuilder:
         self.description = description
         self.reactions = reactions
         self.threadMsgStr = threadMsgStr
+        self.calendar = TrainingCalendar(trainingDayNum)
 
-    async def build(self, channel):
-        # Calculate the date of the next training, for which to send the poll. refDate is tomorrow, in order to send the
-        # poll net for next week if trainingDayNum correspond to today's weekNum. For ex.: if today is saturday,
-        # the poll for the saturday's training will correspond to next week
-        refDate = datetime.datetime.now(tz=CST.USER_TIMEZONE) + datetime.timedelta(days=1)
-        trainingDate = get_date_from_weekday(self.trainingDayNum, refDate=refDate)
-        trainingDateStr = \
-            babel.dates.format_date(trainingDate, format='EEEE d MMMM', locale='fr_FR').capitalize()
+    # Get the next training, for which to send the poll. The reference date is tomorrow, in order to send the
+    # poll for next week if trainingDayNum correspond to today's weekNum. For ex.: if today is saturday,
+    # the poll for the saturday's training will correspond to next week
+    def get_next_training(self):
+        return self.calendar.next_training(datetime.datetime.now(tz=CST.USER_TIMEZONE) + datetime.timedelta(days=1))
+
+    async def build(self, channel, outboundQueue):
+        trainingDateStr = self.get_next_training().title
 
         embed = discord.Embed(title=f"{trainingDateStr}", description=self.description, color=self.color)
 
-        msg = await channel.send(embed=embed)
-        if self.reactions is not None:
-            for reaction in self.reactions:
-                await msg.add_reaction(reaction)
+        msg = await outboundQueue.submit(channel.send, embed=embed,
+                                         priority=outbound.HIGH, route=('send_message', channel.id))
+        # The reactions are added while the thread is created. They're still added in
+        # order, since the actions of a route are executed in submission order.
+        reactionsAdded = [outboundQueue.submit(msg.add_reaction, reaction,
+                                               priority=outbound.HIGH, route=('reaction', channel.id))
+                          for reaction in (self.reactions or [])]
 
-        f = await msg.create_thread(name=trainingDateStr, auto_archive_duration=CST.MAX_THREAD_ARCHIVING_DURATION)
-        await f.send(self.threadMsgStr)
+        f = await outboundQueue.submit(msg.create_thread, name=trainingDateStr,
+                                       auto_archive_duration=CST.MAX_THREAD_ARCHIVING_DURATION,
+                                       priority=outbound.HIGH, route=('create_thread', channel.id))
+        await outboundQueue.submit(f.send, self.threadMsgStr, priority=outbound.HIGH, route=('send_message', f.id))
+        await asyncio.gather(*reactionsAdded)
 
 
 # Routine that sends a poll for a training on a given channel, on a given day of the week.
@@ -50,6 +61,10 @@ class TrainingPollRoutine:
         self.channelId = None
         self.lastExecutionDate = None
         self.cmdKeyWord = cmdKeyWord
+        # Time of the execution, if different from the club's routines trigger time.
+        self.triggerTime = None
+        # Club for which the polls are sent, set when added to it.
+        self.club = None
 
     # Enable this routine and set the execution's day number.
     def enable(self, executionDayNum, channelId):
@@ -58,6 +73,7 @@ class TrainingPollRoutine:
         self.lastExecutionDate = None
         self.isEnabled = True
         self.log("enabled")
+        self.bot.scheduler.schedule(self)
 
     # Disable this routine.
     def disable(self):
@@ -65,6 +81,26 @@ class TrainingPollRoutine:
         self.channelId = None
         self.isEnabled = False
         self.log("disabled")
+        self.bot.scheduler.schedule(self)
+
+    # Set the time of the execution, None to use the club's routines trigger time.
+    def set_trigger_time(self, triggerTime):
+        self.triggerTime = triggerTime
+        self.bot.scheduler.schedule(self)
+
+    def get_trigger_time(self):
+        return self.club.routinesTriggerTime if self.triggerTime is None else self.triggerTime
+
+    # Get the date of the next execution after the given date (now by default), None if disabled.
+    def get_next_execution_date(self, after=None):
+        if not self.isEnabled or self.executionDayNum is None:
+            return None
+        after = datetime.datetime.now(tz=CST.USER_TIMEZONE) if after is None else after.astimezone(CST.USER_TIMEZONE)
+        # Not twice on the same day, for ex. when the trigger time is moved later after the execution.
+        if self.lastExecutionDate is not None:
+            after = max(after, self.lastExecutionDate.astimezone(CST.USER_TIMEZONE).replace(
+                hour=23, minute=59, second=59, microsecond=999999))
+        return get_next_date(self.executionDayNum, self.get_trigger_time(), after)
 
     # If this routine is enabled, send a poll on the set channel,
     # if today is the set execution day.
@@ -82,16 +118,12 @@ class TrainingPollRoutine:
         # self.log(f"alreadyExecutedToday = {alreadyExecutedToday}")
 
         if self.isEnabled and today.weekday() == self.executionDayNum:
-            canceled_trainings = self.bot.canceledTrainings
-            trainingDate = get_date_from_weekday(self.trainingPollMsgBuilder.trainingDayNum)
-            training_canceled = False
-            for canceled_training in canceled_trainings.keys():
-                if trainingDate.strftime("%d/%m") == canceled_training:
-                    training_canceled = True
-                    continue
-            if not training_canceled:
+            canceled_trainings = self.club.canceledTrainings
+            # Same training as the poll's one.
+            canceled_training = self.trainingPollMsgBuilder.get_next_training().key
+            if canceled_training not in canceled_trainings:
                 # comment if use alreadyExecutedToday
-                await self.trainingPollMsgBuilder.build(self.bot.get_channel(self.channelId))
+                await self.trainingPollMsgBuilder.build(self.bot.get_channel(self.channelId), self.bot.outbound)
                 self.lastExecutionDate = datetime.datetime.now(tz=CST.USER_TIMEZONE)
 
                 # uncomment if use alreadyExecutedToday
@@ -104,33 +136,39 @@ class TrainingPollRoutine:
                 self.log(f"canceled training")
                 self.trainingPollMsgBuilder.description = f"⚠️ **L'entraînement est annulé car {canceled_trainings[canceled_training]}.**"
                 self.trainingPollMsgBuilder.reactions = None
-                await self.trainingPollMsgBuilder.build(self.bot.get_channel(self.channelId))
+                await self.trainingPollMsgBuilder.build(self.bot.get_channel(self.channelId), self.bot.outbound)
                 self.lastExecutionDate = datetime.datetime.now(tz=CST.USER_TIMEZONE)
-                del self.bot.canceledTrainings[canceled_training]
+                del self.club.canceledTrainings[canceled_training]
                 await self.bot.save_state()
 
     def log(self, msg):
         print(f"\t[routine \"{self.displayName}\"] {msg}")
 
+    # Name of the routine's section in the bot's state.
+    def get_state_section(self):
+        return self.club.get_state_prefix() + self.name
+
     def save_routines_state(self, state):
 
-        state[self.name] = \
+        state[self.get_state_section()] = \
             {
                 'isEnabled': "" if self.isEnabled is None else self.isEnabled,
                 # isEnabled a forcément une valeur puisqu'il est initialisé a False
                 'execDayNum': "" if self.executionDayNum is None else self.executionDayNum,
                 'channelId': "" if self.channelId is None else self.channelId,
                 'lastExecDate': "" if self.lastExecutionDate is None else self.lastExecutionDate.isoformat(),
+                'triggerTime': "" if self.triggerTime is None else self.triggerTime.isoformat(),
             }
 
     def load_routines_state(self, state):
 
-        if state.has_section(self.name):
-            routineConfig = state[self.name]
+        if state.has_section(self.get_state_section()):
+            routineConfig = state[self.get_state_section()]
             self.isEnabled = routineConfig.getboolean('isEnabled')
             self.executionDayNum = routineConfig.getint('execDayNum')
             self.channelId = routineConfig.getint('channelId')
             self.lastExecutionDate = routineConfig.getdatetime('lastExecDate')
+            self.triggerTime = routineConfig.gettime('triggerTime')
 
 
 # Get the date of the next day associated with the given week day number,
@@ -161,6 +199,10 @@ def format_time_delta(delta: datetime.timedelta):
 # Get the name of the next day associated with the given week day number,
 # from the given reference date. If none is provided, today is used.
 def format_weekday_num(weekDayNum, format='EEEE', refDate=None):
+    if format == 'EEEE':
+        # Doesn't depend on the date.
+        return get_weekday_name(weekDayNum)
+    import babel.dates
     nextTargetDay = get_date_from_weekday(weekDayNum, refDate)
     return babel.dates.format_date(nextTargetDay, format=format, locale='en')
 
@@ -171,137 +213,557 @@ def format_datetime(dateTime, placeholder='never', format='%d/%m/%Y, %H:%M:%S'):
 
 def poll_events(bot):
     @bot.event
+    @bot.metrics.timed
     async def on_raw_reaction_add(payload):
-        user = await bot.fetch_user(payload.user_id)
-        if not user == bot.user:
-            channel = await bot.fetch_channel(payload.channel_id)
-            message = await channel.fetch_message(payload.message_id)
-            emoji = payload.emoji
-            if payload.channel_id == CST.TRAINING_POLLS_CHANNEL_ID:
-                # try:
-                thread = await bot.fetch_channel(
-                    payload.message_id)  # thread.id == message_id if thread starts from this message
-                # mention_msg = await thread.send(user.mention)
-                # await mention_msg.delete()
-                member = await channel.guild.fetch_member(payload.user_id)
-                await addToLog(bot, thread.name, member, emoji)
-                await message.remove_reaction(emoji, user)
-            # except:
-            #     pass
+        if payload.user_id == bot.user.id:
+            return
+        club = bot.clubs.for_channel(payload.channel_id)
+        if club is not None and payload.channel_id == club.trainingPollsChannelId:
+            if bot.eventQueue is not None:
+                # Handled by the worker in charge of this poll.
+                member = payload.member
+                await bot.eventQueue.push('vote', {
+                    'guild_id': payload.guild_id, 'channel_id': payload.channel_id,
+                    'message_id': payload.message_id, 'user_id': payload.user_id, 'emoji': str(payload.emoji),
+                    'member': None if member is None else {'name': member.name, 'nick': member.nick},
+                }, payload.message_id)
+                return
+            # The reactions of a member to a poll are handled one at a time, in the order they
+            # were received, so that a member changing their mind ends with their last vote.
+            async with club.pollStore.lock((payload.message_id, payload.user_id)):
+                await handleVote(bot, club, payload.guild_id, payload.channel_id, payload.message_id,
+                                 payload.user_id, payload.emoji, payload.member)
         return
 
     @bot.event
+    @bot.metrics.timed
     async def on_message(message: discord.Message):
         if message.author == bot.user:
             return
 
         if message.channel.type.name == 'public_thread':
-            if message.channel.parent_id == CST.TRAINING_POLLS_CHANNEL_ID:
+            club = bot.clubs.for_channel(message.channel.parent_id)
+            if club is not None and message.channel.parent_id == club.trainingPollsChannelId:
                 thread = message.channel
-                dateStr = thread.name
-                trackingThread = await findOrCreateTrackingThread(bot, dateStr)
-                pollData = PollData()
-                await pollData.init(trackingThread)
-                ids_to_add = await pollData.getIdsToAdd()
-                for member_id in ids_to_add:
-                    member = await message.channel.guild.fetch_member(member_id)
-                    mention_msg = await thread.send(member.mention)
-                    await mention_msg.delete()
-                await pollData.clearListToAdd()
+                if bot.eventQueue is not None:
+                    # thread.id == poll message id, so the worker in charge of the poll handles it.
+                    await bot.eventQueue.push('thread_message', {
+                        'guild_id': thread.guild.id, 'thread_id': thread.id, 'parent_id': thread.parent_id,
+                        'thread_name': thread.name,
+                    }, thread.id)
+                else:
+                    await handleTrainingThreadMessage(bot, club, thread.guild.id, thread.id, thread.name, thread)
         await bot.process_commands(message)
         return
 
+    @bot.event
+    async def on_thread_create(thread):
+        club = bot.clubs.for_channel(thread.parent_id)
+        if club is not None and thread.parent_id == club.trackingChannelId:
+            club.trackingDirectory.add(thread.name, thread.id, thread.id)
 
-async def addToLog(bot, dateStr, member, emoji):
-    thread = await findOrCreateTrackingThread(bot, dateStr)
-    pollData = PollData()
-    await pollData.init(thread)
-    if emoji.name == "❌":
-        await pollData.deleteMemberToWaitingList(member)
-        await pollData.deleteMemberToList(member)
-    else:
-        await pollData.addMemberToWaitingList(member)
-        await pollData.addMemberToList(member)
+    @bot.event
+    async def on_raw_thread_delete(payload):
+        bot.resolver.forget_channel(payload.thread_id)
+        club = bot.clubs.for_channel(payload.parent_id)
+        if club is not None and payload.parent_id == club.trackingChannelId:
+            club.trackingDirectory.remove(payload.thread_id)
+
+    @bot.event
+    async def on_raw_message_delete(payload):
+        club = bot.clubs.for_channel(payload.channel_id)
+        if club is not None and payload.channel_id == club.trackingChannelId:
+            club.trackingDirectory.remove(payload.message_id)
+
+    # The raw events are received even for the members missing from the gateway cache,
+    # which are the ones kept by the resolver.
+    @bot.event
+    async def on_raw_member_update(payload):
+        await invalidateMember(bot, payload.member.guild.id, payload.member.id)
+
+    @bot.event
+    async def on_raw_member_remove(payload):
+        await invalidateMember(bot, payload.guild_id, payload.user.id)
+
+
+# Forget the given member, so that it's fetched again when needed, in every process.
+async def invalidateMember(bot, guildId, userId):
+    bot.resolver.members.invalidate(guildId, userId)
+    if bot.eventQueue is not None:
+        await bot.eventQueue.push_all('member_invalidate', {'guild_id': guildId, 'user_id': userId})
+
+
+# Handle the given member's vote on a poll of the given club. The caller holds the lock
+# of the member's votes on the poll.
+async def handleVote(bot, club, guildId, channelId, messageId, userId, emoji, member=None):
+    # try:
+    guild = await bot.resolver.guild(guildId)
+    channel = await bot.resolver.channel(channelId)
+    # thread.id == message_id if thread starts from this message
+    thread = await bot.resolver.thread(guild, messageId)
+    # mention_msg = await thread.send(user.mention)
+    # await mention_msg.delete()
+    member = await bot.resolver.member(guild, userId, member)
+    await addToLog(bot, club, thread.name, member, emoji)
+    # no need to fetch the poll message, only its id is needed to remove the reaction
+    message = channel.get_partial_message(messageId)
+    bot.outbound.submit(message.remove_reaction, emoji, member,
+                        route=('reaction', channel.id))
+    # except:
+    #     pass
+
+
+# Handle a message sent in the thread of a training, by adding to the thread the
+# members who voted for it since the last message. The thread is resolved if not given.
+async def handleTrainingThreadMessage(bot, club, guildId, threadId, dateStr, thread=None):
+    await club.trackingDirectory.ensure_built()
+    # Most of the time nobody is waiting to be added, which is known without any I/O.
+    if club.pollStore.may_have_pending_members(dateStr):
+        trackingThread = await findOrCreateTrackingThread(bot, club, dateStr)
+        # The waiting list is taken and cleared at once, so that a vote received
+        # while the members are being added isn't cleared without being handled.
+        async with club.pollStore.lock(dateStr):
+            pollData = await club.pollStore.get(dateStr, trackingThread)
+            ids_to_add = await pollData.take_ids_to_add()
+        if ids_to_add:
+            guild = await bot.resolver.guild(guildId)
+            if thread is None:
+                thread = await bot.resolver.thread(guild, threadId)
+            await addMembersToThread(bot, guild, thread, ids_to_add)
+
+
+# Add the given members to the given thread, by mentioning them all at once in as few
+# messages as possible, deleted right after being sent.
+async def addMembersToThread(bot, guild, thread, memberIds):
+    mentions = []
+    for memberId in memberIds:
+        try:
+            member = await bot.resolver.member(guild, memberId)
+        except discord.NotFound:
+            continue  # the member left the server
+        mentions.append(member.mention)
+    for mentionsStr in chunk_mentions(mentions):
+        mention_msg = await bot.outbound.submit(thread.send, mentionsStr, route=('send_message', thread.id))
+        bot.outbound.submit(mention_msg.delete, route=('delete_message', thread.id))
+
+
+# Split the given mentions (or lines, with "\n" as separator) into strings that each fit in a single message.
+def chunk_mentions(mentions, maxLength=CST.MAX_MESSAGE_LENGTH, separator=" "):
+    chunks = []
+    chunk = ""
+    for mention in mentions:
+        if chunk and len(chunk) + len(separator) + len(mention) > maxLength:
+            chunks.append(chunk)
+            chunk = ""
+        chunk = mention if not chunk else f"{chunk}{separator}{mention}"
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+async def addToLog(bot, club, dateStr, member, emoji):
+    thread = await findOrCreateTrackingThread(bot, club, dateStr)
+    async with club.pollStore.lock(dateStr):
+        pollData = await club.pollStore.get(dateStr, thread)
+        await pollData.record_vote(member, emoji.name != "❌")
+        count = pollData.member_count()
     if member.nick is None:
         name = member.name
     else:
         name = member.nick
-    await thread.send(f"{emoji} voté par **{name}**")
-    count = len(pollData.data["list_of_users"])
-    await thread.send(f"total: {count} personnes")
+    if CST.VOTE_LOG_DIGEST:
+        club.voteLog.record(dateStr, thread, pollData, f"{emoji} voté par **{name}**")
+        return
+    # The vote log is only informative, so it gives way to any other action.
+    bot.outbound.submit(thread.send, f"{emoji} voté par **{name}**",
+                        priority=outbound.LOW, route=('send_message', thread.id))
+    bot.outbound.submit(thread.send, f"total: {count} personnes",
+                        priority=outbound.LOW, route=('send_message', thread.id))
     return
 
 
-async def findOrCreateTrackingThread(bot, dateStr):
-    trackingChannel = await bot.fetch_channel(CST.TRACKING_CHANNEL_ID)
-    allMsg = await bot.get_channel(CST.TRACKING_CHANNEL_ID).history().flatten()
-    message = None
-    for msg in allMsg[0:10]:
-        if msg.content == dateStr:
-            message = msg
-            break
-    if message is None:
-        message = await trackingChannel.send(dateStr)
-        new_thread = await message.create_thread(name=dateStr, auto_archive_duration=CST.MAX_THREAD_ARCHIVING_DURATION)
-        pollData = PollData()  # to create a new pollData message
-        await pollData.init(new_thread)
-    thread = await bot.fetch_channel(message.id)
-    return thread
-
+# Concurrent calls for the same date share the same lookup, so that a tracking thread
+# is never created twice.
+async def findOrCreateTrackingThread(bot, club, dateStr):
+    return await club.trackingDirectory.lookups.do(dateStr, _findOrCreateTrackingThread, bot, club, dateStr)
+
+
+async def _findOrCreateTrackingThread(bot, club, dateStr):
+    await club.trackingDirectory.ensure_built()
+    threadId = club.trackingDirectory.get_thread_id(dateStr)
+    if threadId is None:
+        trackingChannel = await bot.resolver.channel(club.trackingChannelId)
+        message = await bot.outbound.submit(trackingChannel.send, dateStr,
+                                            route=('send_message', trackingChannel.id))
+        new_thread = await bot.outbound.submit(message.create_thread, name=dateStr,
+                                               auto_archive_duration=CST.MAX_THREAD_ARCHIVING_DURATION,
+                                               route=('create_thread', trackingChannel.id))
+        club.trackingDirectory.add(dateStr, message.id, new_thread.id)
+        await club.pollStore.get(dateStr, new_thread, True)  # to create a new pollData message
+        return new_thread
+    trackingChannel = bot.get_channel(club.trackingChannelId)
+    guild = None if trackingChannel is None else trackingChannel.guild
+    return await bot.resolver.thread(guild, threadId)
+
+
+# Index of the tracking threads, giving the ids of the message and of the thread associated
+# with each training date. It is built once with a bounded scan of the tracking channel,
+# then kept up to date from the gateway events, so that lookups need no REST call.
+class TrackingDirectory:
+
+    def __init__(self, bot, trackingChannelId, scanLimit=CST.TRACKING_INDEX_SCAN_LIMIT):
+        self.bot = bot
+        self.trackingChannelId = trackingChannelId
+        self.scanLimit = scanLimit
+        # date string -> (message id, thread id)
+        self.entries = {}
+        self.buildTask = None
+        self.lookups = SingleFlight()
+
+    # Build the index if it hasn't been yet. Concurrent callers wait for the same build,
+    # and a failed build is retried by the next call.
+    async def ensure_built(self):
+        if self.buildTask is None:
+            self.buildTask = self.bot.loop.create_task(self.build())
+        buildTask = self.buildTask
+        try:
+            await buildTask
+        except Exception:
+            if self.buildTask is buildTask:
+                self.buildTask = None
+            raise
+
+    async def build(self):
+        trackingChannel = await self.bot.resolver.channel(self.trackingChannelId)
+        entries = {}
+        # The history is streamed from the newest message, so that the most recent
+        # tracking thread is kept if a date string appears several times.
+        async for msg in trackingChannel.history(limit=self.scanLimit):
+            if msg.author == self.bot.user and msg.content not in entries:
+                # thread.id == message.id since the thread starts from this message
+                entries[msg.content] = (msg.id, msg.id)
+        # Entries added by the gateway events while scanning are more recent.
+        entries.update(self.entries)
+        self.entries = entries
+        self.log(f"indexed {len(self.entries)} tracking threads")
+
+    def get_thread_id(self, dateStr):
+        entry = self.entries.get(dateStr)
+        return None if entry is None else entry[1]
+
+    def add(self, dateStr, messageId, threadId):
+        self.entries[dateStr] = (messageId, threadId)
+
+    # Forget the entry of the given message or thread.
+    def remove(self, channelOrMessageId):
+        for dateStr, entry in list(self.entries.items()):
+            if channelOrMessageId in entry:
+                del self.entries[dateStr]
 
-class PollData:
+    def log(self, msg):
+        print(f"[tracking directory] {msg}")
 
-    def __init__(self):
-        self.data = None
-        self.message = None
 
-    async def init(self, trackingThread):
-        self.message, self.data = await self.__findOrCreateMsg(trackingThread)
+# In-memory store of the polls' data, keyed by training date. It holds the authoritative
+# version of the data: mutations are applied to it immediately, and a write-behind flusher
+# persists them to the Discord data messages, at most once per flush interval.
+class PollStore:
 
-    async def __findOrCreateMsg(self, thread):
-        allMsg = await thread.history().flatten()
-        message = None
-        if allMsg is None:
-            pass
+    def __init__(self, bot, trackingDirectory, flushInterval=CST.POLL_DATA_FLUSH_INTERVAL):
+        self.bot = bot
+        self.trackingDirectory = trackingDirectory
+        self.flushInterval = flushInterval
+        self.polls = {}
+        self.dirtyPolls = set()
+        self.loads = SingleFlight()
+        # Lock per training date, to hold while reading and mutating a poll's data.
+        # Also used per (poll message id, user id), to handle a member's reactions to a poll in order.
+        self.lock = KeyedLocks()
+        self.flusher = DebouncedFlush(self.flush)
+        # Number of edits of the data messages, for monitoring purposes.
+        self.writeCount = 0
+        # poll data -> number of consecutive failed writes
+        self.writeFailures = {}
+
+    # Get the data of the poll of the given training date, loading it from
+    # the tracking thread only the first time. A new tracking thread has no data to look for.
+    async def get(self, dateStr, trackingThread, newThread=False):
+        pollData = self.polls.get(dateStr)
+        if pollData is None:
+            pollData = await self.loads.do(dateStr, self.__load, dateStr, trackingThread, newThread)
+        return pollData
+
+    async def __load(self, dateStr, trackingThread, newThread):
+        pollData = PollData(self)
+        await pollData.init(trackingThread, newThread)
+        self.polls[dateStr] = pollData
+        return pollData
+
+    # Whether some members may be waiting to be added to the thread of the given training
+    # date, answered from memory only.
+    def may_have_pending_members(self, dateStr):
+        pollData = self.polls.get(dateStr)
+        if pollData is None:
+            # Not loaded yet: only a poll that already has a tracking thread can have votes.
+            return self.trackingDirectory.get_thread_id(dateStr) is not None
+        return pollData.has_ids_to_add()
+
+    # Schedule the persistence of the given poll data, unless a flush is already pending.
+    def mark_dirty(self, pollData):
+        self.dirtyPolls.add(pollData)
+        self.flusher.schedule(self.flushInterval)
+
+    async def flush(self):
+        dirtyPolls = self.dirtyPolls
+        self.dirtyPolls = set()
+        # An edit still waiting in the outbound queue for the same message is coalesced with this one.
+        writes = {pollData: self.bot.outbound.submit(pollData.write,
+                                                     route=('edit_message', pollData.message.channel.id),
+                                                     key=('edit_message', pollData.message.id))
+                  for pollData in dirtyPolls}
+        for pollData, write in writes.items():
+            try:
+                await write
+                self.writeCount += 1
+                self.writeFailures.pop(pollData, None)
+            except discord.HTTPException as e:
+                # A 4xx error (ex: the data message was deleted, or a permission is missing)
+                # would happen again. The data is written again by its next change.
+                if e.status == 429 or e.status >= 500:
+                    self.__retry_later(pollData, e)
+                else:
+                    self.writeFailures.pop(pollData, None)
+                    self.log(f"failed to write poll data ({e}), dropped until its next change")
+            except Exception as e:
+                self.__retry_later(pollData, e)
+
+    def __retry_later(self, pollData, e):
+        failures = self.writeFailures.get(pollData, 0) + 1
+        if failures > CST.POLL_DATA_WRITE_RETRIES:
+            self.writeFailures.pop(pollData, None)
+            self.log(f"failed to write poll data ({e!r}) {failures} times, dropped until its next change")
         else:
-            for msg in reversed(allMsg):  # reversed to start with first posted message
-                if msg.content.startswith("{"):
-                    message = msg
+            self.writeFailures[pollData] = failures
+            self.log(f"failed to write poll data ({e!r}), will retry on next flush")
+            self.mark_dirty(pollData)
+
+    # Flush all pending changes right away, for ex. before shutting the bot down,
+    # along with the retries of the writes failing meanwhile.
+    async def close(self):
+        await self.flusher.flush()
+
+    def log(self, msg):
+        print(f"[poll store] {msg}")
+
+
+# Log of the votes of each poll, in its tracking thread: a pinned summary message giving the
+# number of members coming and their list, edited after the votes, and the votes themselves,
+# sent in digest messages, both at most once per flush interval.
+class VoteLog:
+
+    def __init__(self, bot, flushInterval=CST.VOTE_LOG_FLUSH_INTERVAL):
+        self.bot = bot
+        self.flushInterval = flushInterval
+        # training date -> (tracking thread, poll data, vote lines not sent yet)
+        self.pendingVotes = {}
+        # training date -> summary message
+        self.summaryMsgs = {}
+        self.summaryLookups = SingleFlight()
+        self.flusher = DebouncedFlush(self.flush)
+        # metrics
+        self.digestCount = 0
+        self.summaryEditCount = 0
+
+    # Add the given vote line to the log of the given training date.
+    def record(self, dateStr, trackingThread, pollData, line):
+        pending = self.pendingVotes.setdefault(dateStr, (trackingThread, pollData, []))
+        pending[2].append(line)
+        self.flusher.schedule(self.flushInterval)
+
+    async def flush(self):
+        pendingVotes = self.pendingVotes
+        self.pendingVotes = {}
+        for dateStr, (thread, pollData, lines) in pendingVotes.items():
+            # With the lowest priority, as the messages of the non-digest mode (see addToLog).
+            for digest in chunk_mentions(lines, separator="\n"):
+                self.bot.outbound.submit(thread.send, digest,
+                                         priority=outbound.LOW, route=('send_message', thread.id))
+                self.digestCount += 1
+            try:
+                summaryMsg = await self.summaryLookups.do(dateStr, self.__findOrCreateSummary, dateStr, thread,
+                                                          pollData)
+            except discord.HTTPException as e:
+                self.log(f"couldn't send the summary of {dateStr}: {e}")
+                continue
+            # An edit of the summary still waiting in the outbound queue is replaced by this one.
+            self.bot.outbound.submit(summaryMsg.edit, content=format_vote_summary(pollData),
+                                     allowed_mentions=discord.AllowedMentions.none(),
+                                     priority=outbound.LOW, route=('edit_message', thread.id),
+                                     key=('edit_message', summaryMsg.id))
+            self.summaryEditCount += 1
+
+    async def __findOrCreateSummary(self, dateStr, thread, pollData):
+        summaryMsg = self.summaryMsgs.get(dateStr)
+        if summaryMsg is None:
+            async for pin in thread.pins():
+                # Without the prefix's trailing space, as Discord trims the messages' content.
+                if pin.message.content.startswith(VOTE_SUMMARY_PREFIX.rstrip()):
+                    summaryMsg = pin.message
                     break
-        if message is None:
-            message = await thread.send({"user_ids_to_add": [], "list_of_users": []})
-        data = ast.literal_eval(message.content)
-        return message, data
+        if summaryMsg is None:
+            # Sent complete, so that it's found again even if the bot stops before editing it.
+            summaryMsg = await self.bot.outbound.submit(thread.send, format_vote_summary(pollData),
+                                                        allowed_mentions=discord.AllowedMentions.none(),
+                                                        priority=outbound.LOW, route=('send_message', thread.id))
+            await self.bot.outbound.submit(summaryMsg.pin, priority=outbound.LOW, route=('pin_message', thread.id))
+        self.summaryMsgs[dateStr] = summaryMsg
+        return summaryMsg
+
+    # Send the votes left right away, for ex. before shutting the bot down.
+    async def close(self):
+        await self.flusher.flush()
+
+    def stats(self):
+        return {'pending_votes': sum(len(lines) for thread, pollData, lines in self.pendingVotes.values()),
+                'digests': self.digestCount, 'summary_edits': self.summaryEditCount}
 
-    async def getMemberList(self):
-        return self.data["list_of_users"]
+    def log(self, msg):
+        print(f"[vote log] {msg}")
 
-    async def getIdsToAdd(self):
-        return self.data["user_ids_to_add"]
 
-    async def addMemberToList(self, member):
-        if not (member.id in self.data["list_of_users"]):
-            self.data["list_of_users"].append(member.id)
-            await self.__writeData()
+VOTE_SUMMARY_PREFIX = "📊 "
 
-    async def addMemberToWaitingList(self, member):
-        if not (member.id in self.data["list_of_users"]):
-            self.data["user_ids_to_add"].append(member.id)
-            await self.__writeData()
 
-    async def deleteMemberToList(self, member):
-        if (member.id in self.data["list_of_users"]):
-            self.data["list_of_users"].remove(member.id)
-            await self.__writeData()
+# Content of the summary message of the given poll: the number of members coming, and their list.
+def format_vote_summary(pollData, maxLength=CST.MAX_MESSAGE_LENGTH):
+    header = f"{VOTE_SUMMARY_PREFIX}**total: {pollData.member_count()} personnes**\n"
+    mentions = chunk_mentions([f"<@{memberId}>" for memberId in pollData.members], maxLength - len(header) - 20)
+    summary = header + (mentions[0] if mentions else "")
+    if len(mentions) > 1:
+        summary += f" … (+{pollData.member_count() - mentions[0].count('<@')})"
+    return summary
+
 
-    async def deleteMemberToWaitingList(self, member):
-        if (member.id in self.data["user_ids_to_add"]):
-            self.data["user_ids_to_add"].remove(member.id)
+# Get the data messages (shards) among the given messages, by shard index.
+def get_shards(messages):
+    shards = {}
+    for msg in messages:
+        if pollDataFormat.is_shard(msg.content):
+            shards.setdefault(pollDataFormat.shard_index(msg.content), msg)
+    return shards
+
+
+# Data of a training poll, persisted in messages of its tracking thread (see pollDataFormat):
+# the members who voted for the training, and among them the ones waiting to be added to
+# its thread. Both are dicts used as sets, which keep the members in the order they voted.
+class PollData:
+
+    __slots__ = ('members', 'idsToAdd', 'messages', 'contents', 'store')
+
+    def __init__(self, store=None):
+        self.members = {}
+        self.idsToAdd = {}
+        # data messages, one per shard, and their content as last written
+        self.messages = []
+        self.contents = []
+        # Store in charge of persisting this data. If None, every mutation is written directly.
+        self.store = store
+
+    # First data message, the one written first.
+    @property
+    def message(self):
+        return self.messages[0]
+
+    async def init(self, trackingThread, newThread=False):
+        if newThread:
+            await self.__createMsg(trackingThread)
+        else:
+            await self.__findOrCreateMsgs(trackingThread)
+
+    async def __findOrCreateMsgs(self, thread):
+        # The data messages are pinned when sent, so that they're found with a single request,
+        # however long the votes' log is.
+        shards = get_shards([pin.message async for pin in thread.pins()])
+        legacyMsg = None
+        if not shards:
+            # Not pinned (sent before they were, or the pinning failed): the data messages
+            # are then among the first of the thread, sent before the votes' log.
+            firstMsgs = await thread.history(limit=CST.POLL_DATA_SCAN_LIMIT, oldest_first=True).flatten()
+            shards = get_shards(firstMsgs)
+            legacyMsg = next((msg for msg in firstMsgs if pollDataFormat.is_legacy(msg.content)), None)
+            for msg in shards.values() if shards else filter(None, [legacyMsg]):
+                await self.__pin(msg)
+        if shards:
+            self.messages = [shards[index] for index in sorted(shards)]
+            self.contents = [msg.content for msg in self.messages]
+            self.members, self.idsToAdd = pollDataFormat.decode(self.contents)
+        elif legacyMsg is not None:
+            # Written in the former format: rewritten in the current one, by the next write.
+            self.messages = [legacyMsg]
+            self.contents = [legacyMsg.content]
+            self.members, self.idsToAdd = pollDataFormat.decode_legacy(legacyMsg.content)
             await self.__writeData()
+        else:
+            await self.__createMsg(thread)
+
+    async def __createMsg(self, thread):
+        self.contents = pollDataFormat.encode(self.members, self.idsToAdd)
+        self.messages = [await thread.send(self.contents[0])]
+        await self.__pin(self.message)
+
+    async def __pin(self, msg):
+        try:
+            await msg.pin()
+        except discord.HTTPException as e:
+            # Still found by the scan of the first messages of the thread.
+            print(f"[poll data] couldn't pin a data message: {e}")
+
+    def member_count(self):
+        return len(self.members)
+
+    def has_ids_to_add(self):
+        return len(self.idsToAdd) > 0
+
+    # Record the vote of the given member, for or against attending the training.
+    # A member voting for it is also waiting to be added to its thread, until then.
+    # Return whether the data changed, in which case it's written once.
+    async def record_vote(self, member, attending):
+        if attending:
+            changed = member.id not in self.members
+            if changed:
+                self.members[member.id] = None
+                self.idsToAdd[member.id] = None
+        else:
+            changed = member.id in self.members or member.id in self.idsToAdd
+            self.members.pop(member.id, None)
+            self.idsToAdd.pop(member.id, None)
+        if changed:
+            await self.__writeData()
+        return changed
 
-    async def clearListToAdd(self):
-        self.data["user_ids_to_add"].clear()
-        await self.__writeData()
+    # Take the ids of the members waiting to be added to the thread, the list being cleared.
+    async def take_ids_to_add(self):
+        ids = list(self.idsToAdd)
+        if ids:
+            self.idsToAdd = {}
+            await self.__writeData()
+        return ids
 
     async def __writeData(self):
-        await self.message.edit(self.data)
+        if self.store is None:
+            await self.write()
+        else:
+            self.store.mark_dirty(self)
+
+    # Write the shards that changed, sending the new ones. The shards no longer needed are
+    # kept, emptied, to be used again.
+    async def write(self):
+        contents = pollDataFormat.encode(self.members, self.idsToAdd, len(self.messages))
+        for index, content in enumerate(contents):
+            if index == len(self.messages):
+                self.messages.append(await self.message.channel.send(content))
+                self.contents.append(content)
+                await self.__pin(self.messages[-1])
+            elif content != self.contents[index]:
+                await self.messages[index].edit(content=content)
+                self.contents[index] = content
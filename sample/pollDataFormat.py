@@ -0,0 +1,76 @@
+import ast
+
+import constants as CST
+
+# Version of the format, written at the start of every data message.
+PREFIX = "pd1 "
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+# Ids of an empty shard, as Discord trims the messages' content.
+NO_IDS = "-"
+
+
+# Format of the poll data messages. The data is split into shards, each holding a slice of
+# the members (in base 36, comma separated) and the bitmap of the ones waiting to be added
+# to the thread among them, as "pd1 <shard index> <bitmap> <ids>". The members waiting are
+# always members who voted for the training, so the bitmap is enough to tell them apart.
+# A shard takes at most ~14 characters per member, where the former format, repr() of a
+# dict of lists, took up to ~21, and was limited to a single message.
+
+# Encode the given data into at least minShards shards, the extra ones being empty.
+def encode(members, idsToAdd, minShards=1, idsPerShard=CST.POLL_DATA_IDS_PER_MESSAGE):
+    members = list(members)
+    shards = []
+    for index in range(max(minShards, -(-len(members) // idsPerShard))):
+        ids = members[index * idsPerShard:(index + 1) * idsPerShard]
+        bitmap = 0
+        for bit, memberId in enumerate(ids):
+            if memberId in idsToAdd:
+                bitmap |= 1 << bit
+        idsStr = ','.join(to_base36(memberId) for memberId in ids) if ids else NO_IDS
+        shards.append(f"{PREFIX}{index} {to_base36(bitmap)} {idsStr}")
+    return shards
+
+
+def is_shard(content):
+    return content.startswith(PREFIX)
+
+
+# Get the index of the given shard.
+def shard_index(content):
+    return int(content.split(' ', 2)[1])
+
+
+# Decode the given shards, sorted by index, into (members, ids to add), as dicts used as ordered sets.
+def decode(shards):
+    members = {}
+    idsToAdd = {}
+    for content in shards:
+        # Shards written with no ids at all were trimmed by Discord, to "pd1 <index> <bitmap>".
+        prefix, index, bitmap, ids = (content.strip().split(' ', 3) + [NO_IDS])[:4]
+        bitmap = int(bitmap, 36)
+        for bit, memberId in enumerate(ids.split(',') if ids != NO_IDS else ()):
+            memberId = int(memberId, 36)
+            members[memberId] = None
+            if bitmap >> bit & 1:
+                idsToAdd[memberId] = None
+    return members, idsToAdd
+
+
+# Whether the given content is in the former format.
+def is_legacy(content):
+    return content.startswith("{")
+
+
+def decode_legacy(content):
+    data = ast.literal_eval(content)
+    return dict.fromkeys(data["list_of_users"]), dict.fromkeys(data["user_ids_to_add"])
+
+
+def to_base36(number):
+    if number == 0:
+        return "0"
+    chars = []
+    while number:
+        number, digit = divmod(number, 36)
+        chars.append(DIGITS[digit])
+    return "".join(reversed(chars))
@@ -0,0 +1,84 @@
+import asyncio
+import datetime
+import time
+
+import discord
+import constants as CST
+
+
+# Deletion of all the messages and threads of a channel. The messages are read from the
+# newest, and deleted by bulks of 100 while young enough, then one by one, concurrently,
+# as are the threads. The actions are made directly rather than through the outbound
+# queue, which would be flooded, and pycord waits for the rate limits.
+class ChannelPurge:
+
+    def __init__(self, channel, concurrency=CST.PURGE_CONCURRENCY, keptIds=()):
+        self.channel = channel
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # Ids of the messages not to delete (ex: the message reporting the progress).
+        self.keptIds = set(keptIds)
+        self.deletedCount = 0
+        self.bulkDeletedCount = 0
+        self.threadCount = 0
+        self.failedCount = 0
+        self.startTime = None
+        self.endTime = None
+
+    async def run(self):
+        self.startTime = time.perf_counter()
+        deletions = [asyncio.ensure_future(self.__delete(thread.delete(), isThread=True))
+                     for thread in self.channel.threads]
+        # Discord refuses to bulk delete messages older than 2 weeks, a minute being kept to be safe.
+        bulkLimitDate = datetime.datetime.now(tz=datetime.timezone.utc) \
+            - datetime.timedelta(seconds=CST.BULK_DELETE_MAX_AGE - 60)
+        bulk = []
+        async for msg in self.channel.history(limit=None):
+            if msg.id in self.keptIds:
+                continue
+            if msg.created_at > bulkLimitDate:
+                bulk.append(msg)
+                if len(bulk) == CST.BULK_DELETE_MAX_COUNT:
+                    await self.__delete_bulk(bulk)
+                    bulk = []
+            else:
+                deletions.append(asyncio.ensure_future(self.__delete(msg.delete())))
+        if bulk:
+            await self.__delete_bulk(bulk)
+        await asyncio.gather(*deletions)
+        self.endTime = time.perf_counter()
+        return self
+
+    async def __delete_bulk(self, msgs):
+        if len(msgs) == 1:
+            # A bulk needs at least 2 messages.
+            await self.__delete(msgs[0].delete())
+            return
+        try:
+            await self.channel.delete_messages(msgs)
+        except discord.HTTPException as e:
+            print(f"[purge] couldn't delete {len(msgs)} messages of {self.channel.name}: {e}")
+            self.failedCount += len(msgs)
+        else:
+            self.deletedCount += len(msgs)
+            self.bulkDeletedCount += len(msgs)
+
+    async def __delete(self, deletion, isThread=False):
+        async with self.semaphore:
+            try:
+                await deletion
+            except discord.NotFound:
+                pass  # already deleted
+            except discord.HTTPException as e:
+                print(f"[purge] couldn't delete in {self.channel.name}: {e}")
+                self.failedCount += 1
+                return
+        if isThread:
+            self.threadCount += 1
+        else:
+            self.deletedCount += 1
+
+    def report(self):
+        duration = (time.perf_counter() if self.endTime is None else self.endTime) - self.startTime
+        return f"{self.deletedCount} messages ({self.bulkDeletedCount} in bulk) and {self.threadCount} threads " \
+               f"deleted in {duration:.1f}s ({(self.deletedCount + self.threadCount) / max(duration, 0.001):.1f}/s)" \
+               + ("" if self.failedCount == 0 else f", {self.failedCount} failed")
@@ -0,0 +1,138 @@
+import collections
+import time
+
+import constants as CST
+from concurrency import SingleFlight
+
+
+# Bounded cache of the members fetched from the REST API, keyed by (guild id, user id).
+# The least recently used member is evicted when full, and a member is fetched again
+# once its entry expired, in case an update of it was missed.
+class MemberCache:
+
+    def __init__(self, maxSize=CST.MEMBER_CACHE_SIZE, ttl=CST.MEMBER_CACHE_TTL):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        # (guild id, user id) -> (expiration time, member), from the least to the most recently used
+        self.entries = collections.OrderedDict()
+        # metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictedCount = 0
+        self.expiredCount = 0
+
+    def get(self, guildId, userId):
+        key = (guildId, userId)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            del self.entries[key]
+            self.expiredCount += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, guildId, member):
+        key = (guildId, member.id)
+        self.entries[key] = (time.monotonic() + self.ttl, member)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+            self.evictedCount += 1
+
+    def invalidate(self, guildId, userId):
+        self.entries.pop((guildId, userId), None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'ratio': self.hits / lookups if lookups else 0.0,
+                'evicted': self.evictedCount, 'expired': self.expiredCount}
+
+
+# Resolves the Discord objects needed by the event handlers (channels, threads,
+# members), looking into the gateway cache first and only falling back to the
+# REST API on a cache miss.
+class CacheResolver:
+
+    def __init__(self, bot):
+        self.bot = bot
+        # Number of cache hits and misses, per kind of resolved object.
+        self.hits = {}
+        self.misses = {}
+        # Guilds, channels and threads fetched, when not received from the gateway (ex: in a worker process).
+        self.fetchedGuilds = {}
+        self.fetchedChannels = {}
+        self.channelFetches = SingleFlight()
+        # Members missing from the gateway cache (it isn't filled at startup), once fetched.
+        self.members = MemberCache()
+        self.memberFetches = SingleFlight()
+
+    async def guild(self, guildId):
+        guild = self.bot.get_guild(guildId) or self.fetchedGuilds.get(guildId)
+        if self.__count('guild', guild):
+            return guild
+        guild = await self.bot.fetch_guild(guildId)
+        self.fetchedGuilds[guildId] = guild
+        return guild
+
+    async def channel(self, channelId):
+        channel = self.bot.get_channel(channelId) or self.fetchedChannels.get(channelId)
+        if self.__count('channel', channel):
+            return channel
+        return await self.channelFetches.do(channelId, self.__fetch_channel, channelId)
+
+    # Threads may be missing from the channel cache (for ex. when archived),
+    # so the guild's thread cache is also checked before fetching it.
+    async def thread(self, guild, threadId):
+        thread = self.bot.get_channel(threadId)
+        if thread is None and guild is not None:
+            thread = guild.get_thread(threadId)
+        if thread is None:
+            thread = self.fetchedChannels.get(threadId)
+        if self.__count('thread', thread):
+            return thread
+        return await self.channelFetches.do(threadId, self.__fetch_channel, threadId)
+
+    async def __fetch_channel(self, channelId):
+        channel = await self.bot.fetch_channel(channelId)
+        self.fetchedChannels[channelId] = channel
+        return channel
+
+    # Forget the given fetched channel or thread, once deleted.
+    def forget_channel(self, channelId):
+        self.fetchedChannels.pop(channelId, None)
+
+    # The member given by a gateway payload (payload.member) is used as is,
+    # since it is always up-to-date, and replaces the cached one.
+    async def member(self, guild, userId, member=None):
+        if member is not None:
+            self.members.put(guild.id, member)
+        else:
+            member = guild.get_member(userId) or self.members.get(guild.id, userId)
+        if self.__count('member', member):
+            return member
+        # Concurrent handlers needing the same member share the same fetch.
+        return await self.memberFetches.do((guild.id, userId), self.__fetch_member, guild, userId)
+
+    async def __fetch_member(self, guild, userId):
+        member = await guild.fetch_member(userId)
+        self.members.put(guild.id, member)
+        return member
+
+    # Get the number of hits and misses, and the hit ratio, per kind of object.
+    def stats(self):
+        stats = {}
+        for kind in sorted(set(self.hits) | set(self.misses)):
+            hits = self.hits.get(kind, 0)
+            misses = self.misses.get(kind, 0)
+            stats[kind] = {'hits': hits, 'misses': misses, 'ratio': hits / (hits + misses)}
+        return stats
+
+    def __count(self, kind, obj):
+        counters = self.misses if obj is None else self.hits
+        counters[kind] = counters.get(kind, 0) + 1
+        return obj is not None
@@ -0,0 +1,113 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+
+from dateutil import tz
+
+import constants as CST
+
+
+# Scheduler of the routines: each enabled routine has an absolute deadline, its next
+# execution date, kept in a min-heap so that the loop only wakes up when the earliest
+# one is due.
+class RoutineScheduler:
+
+    def __init__(self, bot):
+        self.bot = bot
+        # (deadline timestamp, seq, routine), some entries being outdated
+        self.heap = []
+        self.seqs = itertools.count()
+        # routine -> (deadline, seq) of its current entry in the heap
+        self.entries = {}
+        self.wakeUp = asyncio.Event()
+        self.task = None
+        self.startTime = None
+
+    # Schedule the next execution of the given routine, replacing the previous one.
+    # A disabled routine is only unscheduled.
+    def schedule(self, routine, now=None):
+        deadline = routine.get_next_execution_date(now)
+        if deadline is None:
+            self.entries.pop(routine, None)
+        else:
+            seq = next(self.seqs)
+            self.entries[routine] = (deadline, seq)
+            heapq.heappush(self.heap, (deadline.timestamp(), seq, routine))
+        # The earliest deadline may have changed.
+        self.wakeUp.set()
+
+    def schedule_all(self):
+        now = datetime.datetime.now(tz=CST.USER_TIMEZONE)
+        for routine in self.bot.clubs.routines():
+            self.schedule(routine, now)
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = self.bot.loop.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+        self.startTime = datetime.datetime.now(tz=CST.USER_TIMEZONE)
+
+        while not self.bot.is_closed():
+            self.wakeUp.clear()
+            self.__discard_outdated()
+            if self.heap:
+                # Also capped to recompute the delay regularly, in case the system clock changed.
+                delay = min(self.heap[0][0] - datetime.datetime.now(tz=CST.USER_TIMEZONE).timestamp(),
+                            CST.MAX_SLEEP_DURATION)
+            else:
+                delay = None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeUp.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            dueRoutines = self.__pop_due()
+            await self.bot.run_routines_once(dueRoutines)
+            for routine in dueRoutines:
+                self.schedule(routine)
+
+    # Remove the outdated entries from the top of the heap.
+    def __discard_outdated(self):
+        while self.heap and not self.__is_current(self.heap[0]):
+            heapq.heappop(self.heap)
+
+    def __is_current(self, entry):
+        timestamp, seq, routine = entry
+        current = self.entries.get(routine)
+        return current is not None and current[1] == seq
+
+    def __pop_due(self):
+        now = datetime.datetime.now(tz=CST.USER_TIMEZONE).timestamp()
+        dueRoutines = []
+        while self.heap and self.heap[0][0] <= now:
+            entry = heapq.heappop(self.heap)
+            if self.__is_current(entry):
+                del self.entries[entry[2]]
+                dueRoutines.append(entry[2])
+        return dueRoutines
+
+    # Upcoming executions, as [(deadline, routine)] sorted by deadline.
+    def upcoming(self):
+        return sorted(((deadline, routine) for routine, (deadline, seq) in self.entries.items()),
+                      key=lambda job: job[0])
+
+
+# Get the next date, after the given one, that is on the given week day and at the given
+# time of the user's time zone. A time skipped by a DST change is moved after the change.
+def get_next_date(weekDayNum, atTime, after):
+    date = after.date() + datetime.timedelta(days=(weekDayNum - after.weekday()) % 7)
+    while True:
+        nextDate = tz.resolve_imaginary(datetime.datetime.combine(date, atTime, tzinfo=CST.USER_TIMEZONE))
+        if nextDate > after:
+            return nextDate
+        date += datetime.timedelta(days=7)
@@ -0,0 +1,71 @@
+import builtins
+import contextlib
+import sys
+import time
+
+import constants as CST
+
+
+# Durations of the bot's startup steps (imports, initializations, cogs loading,
+# state loading...), to know what the time to ready is spent on.
+class StartupProfile:
+
+    def __init__(self):
+        self.startTime = time.perf_counter()
+        # [(step name, duration in seconds)], in execution order
+        self.steps = []
+        # Time from the start to the first on_ready's end, None until then.
+        self.timeToReady = None
+
+    @contextlib.contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - start))
+
+    # Time the first import of each module within this context, as python -X importtime does: a
+    # module's step is the time spent importing it, without the modules it imports, which have
+    # their own steps, except the ones imported relatively, counted with the package importing them.
+    # The modules imported faster than the given duration (in seconds) are left out.
+    @contextlib.contextmanager
+    def imports(self, minDuration=CST.STARTUP_IMPORT_MIN_DURATION):
+        originalImport = builtins.__import__
+        # time spent in the nested imports, per import in progress
+        nestedDurations = []
+
+        def timedImport(name, globals=None, locals=None, fromlist=(), level=0):
+            if level != 0 or name in sys.modules:
+                return originalImport(name, globals, locals, fromlist, level)
+            nestedDurations.append(0.0)
+            start = time.perf_counter()
+            try:
+                return originalImport(name, globals, locals, fromlist, level)
+            finally:
+                duration = time.perf_counter() - start
+                ownDuration = duration - nestedDurations.pop()
+                if nestedDurations:
+                    nestedDurations[-1] += duration
+                if ownDuration >= minDuration:
+                    self.steps.append((f"import {name}", ownDuration))
+
+        builtins.__import__ = timedImport
+        try:
+            yield
+        finally:
+            builtins.__import__ = originalImport
+
+    def elapsed(self):
+        return time.perf_counter() - self.startTime
+
+    def mark_ready(self):
+        if self.timeToReady is None:
+            self.timeToReady = self.elapsed()
+
+    def report(self):
+        lines = [f"ready in {self.timeToReady:.3f}s" if self.timeToReady is not None
+                 else f"not ready after {self.elapsed():.3f}s"]
+        # The remaining time is mostly spent connecting to the gateway.
+        lines += [f"  {name}: {duration * 1000:.1f}ms" for name, duration in self.steps]
+        return "\n".join(lines)
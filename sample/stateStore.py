@@ -0,0 +1,50 @@
+import sqlite3
+
+import constants as CST
+
+
+# Local store of the bot's state: a SQLite database in WAL mode, with one row per
+# (section, key) of the state. Reading it takes a few milliseconds, whereas reading the
+# state message requires crawling the config channel's history.
+class SqliteStateStore:
+
+    def __init__(self, path=CST.STATE_DB_PATH):
+        self.path = path
+        self.connection = None
+
+    def __connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            # In WAL mode, this is still safe against the bot's crashes, only not against the host's.
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS state ("
+                                    "section TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                                    "PRIMARY KEY (section, key))")
+        return self.connection
+
+    # Fill the given parser with the stored state. Return False if nothing was stored yet,
+    # for ex. on a new host, or after Heroku reset the file system.
+    def read(self, state):
+        rows = self.__connect().execute("SELECT section, key, value FROM state").fetchall()
+        sections = {}
+        for section, key, value in rows:
+            sections.setdefault(section, {})[key] = value
+        state.read_dict(sections)
+        return len(rows) > 0
+
+    # Replace the stored sections by the given ones of the parser (all of them by default).
+    def write(self, state, sections=None):
+        sections = state.sections() if sections is None else sections
+        with self.__connect() as connection:  # in a single transaction
+            for section in sections:
+                connection.execute("DELETE FROM state WHERE section = ?", (section,))
+                if state.has_section(section):
+                    connection.executemany("INSERT INTO state VALUES (?, ?, ?)",
+                                           [(section, key, value)
+                                            for key, value in state.items(section, raw=True)])
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
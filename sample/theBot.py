@@ -4,32 +4,67 @@ import configparser
 import datetime
 import asyncio
 import json
+import sqlite3
+import time
+import traceback
 
 import discord
 from discord.ext import commands
 import constants as CST
 from poll import poll_events
+from clubs import Club, ClubRegistry
+from resolver import CacheResolver
+from outbound import OutboundQueue
+from metrics import Metrics
+from stateStore import SqliteStateStore
+from concurrency import DebouncedFlush
+from scheduler import RoutineScheduler
+from startupProfile import StartupProfile
+from archivingSweeper import ArchivingSweeper
+import outbound
 #from functionnalities import roleonjoin
 
 
+# With automatic sharding, the guilds are spread over several gateway connections.
+BotBase = commands.AutoShardedBot if CST.AUTO_SHARDING else commands.Bot
+
+
 # The bot that receives all commands.
 # class TheBot(commands.Bot):
-class TheBot(commands.Bot):
-    def __init__(self):
+class TheBot(BotBase):
+    def __init__(self, startupProfile=None):
+        self.startupProfile = StartupProfile() if startupProfile is None else startupProfile
+        with self.startupProfile.step('init bot'):
+            self.__init_bot()
+        self.deferredCogsLoaded = False
+        self.load_commands()
+        poll_events(self)
+
+    def __init_bot(self):
+        intents = discord.Intents.all()
+        # The presences aren't used, and they're the biggest part of the gateway's traffic.
+        intents.presences = False
         super().__init__(command_prefix=commands.when_mentioned_or('?'), case_insensitive=False,
-                         intents=discord.Intents.all())
+                         intents=intents, chunk_guilds_at_startup=CST.CHUNK_GUILDS_AT_STARTUP)
         self.param = BotParameters()
-        self.canceledTrainings = {}
+        self.metrics = Metrics(self)
+        self.metrics.instrument_http(self.http)
+        self.resolver = CacheResolver(self)
+        self.outbound = OutboundQueue(self)
+        # The clubs served, each with its own channels, routines, canceled trainings and polls.
+        self.clubs = ClubRegistry()
+        self.clubs.add(Club(self, CST.DEFAULT_CLUB_NAME, CST.TRAINING_POLLS_CHANNEL_ID, CST.TRACKING_CHANNEL_ID,
+                            CST.TEST_CHANNEL_ID))
         #self.protectedThreads = []
         #self.noArchivingChannels = []  # channels where all threads are protected from archiving
-        self.routines = []
-        self.routinesTask = None
-        self.routinesTaskStartTime = None
-        # By giving no argument, this will be midnight by default.
-        self.routinesTriggerTime = datetime.time()
+        self.scheduler = RoutineScheduler(self)
+        self.archivingSweeper = ArchivingSweeper(self)
+        # Queue where the gateway process pushes the poll events, in the split mode (see main.py).
+        # If None, they're handled in this process.
+        self.eventQueue = None
+        # Worker handling the poll events pushed by the gateway process, in a worker process.
+        self.pollWorker = None
         self.lastRoutinesTriggerDate = None
-        self.load_commands()
-        poll_events(self)
 
     def load_commands(self):
 
@@ -42,26 +77,44 @@ class TheBot(commands.Bot):
             print('reload done')
 
         for filename in os.listdir('./sample/cogs'):
-            if filename.endswith('.py'):
-                self.load_extension(f'cogs.{filename[:-3]}')
+            if filename.endswith('.py') and filename[:-3] not in CST.DEFERRED_COGS:
+                with self.startupProfile.step(f'load cog {filename[:-3]}'):
+                    self.load_extension(f'cogs.{filename[:-3]}')
         # print(len(self.pending_application_commands))
 
+    # Load the cogs that aren't needed to be ready.
+    async def load_deferred_cogs(self):
+        if self.deferredCogsLoaded:
+            return
+        self.deferredCogsLoaded = True
+        commandCount = len(self.pending_application_commands)
+        for name in CST.DEFERRED_COGS:
+            with self.startupProfile.step(f'load cog {name} (deferred)'):
+                self.load_extension(f'cogs.{name}')
+        if len(self.pending_application_commands) != commandCount:
+            # Not synced on purpose: the commands were already synced on connection.
+            self.log("a deferred cog defines application commands, it should be loaded at startup")
+
     async def on_ready(self):
 
         self.log(f'Logged in as {self.user} (ID: {self.user.id})')
 
-        await self.load_state_and_config()
+        with self.startupProfile.step('load state and config'):
+            await self.load_state_and_config()
+        self.clubs.resolve_guilds(self)
+        with self.startupProfile.step('build tracking directories'):
+            await asyncio.gather(*[self.build_tracking_directory(club) for club in self.clubs])
 
         # If a routines trigger time is set.
         # DISABLED: since the script is currently hosted on Heroku, and Heroku
         # restarts its virtual hosts every day (resetting the state file),
         # we don't want the bot to think it missed the last trigger on every reboot.
-        if False and self.routinesTriggerTime is not None:
+        if False and self.clubs.default().routinesTriggerTime is not None:
 
             # Calculate the date of the previous trigger,
             # which is the date of the next trigger minus one day,
             # since the routines are triggered once a day.
-            previousTriggerDate = self.get_next_trigger_date() - datetime.timedelta(days=1)
+            previousTriggerDate = self.clubs.default().get_next_trigger_date() - datetime.timedelta(days=1)
 
             # If the last routines trigger happened before the supposed previous trigger date,
             # that means the bot missed a trigger, so try to make up for it
@@ -71,90 +124,119 @@ class TheBot(commands.Bot):
                 await self.run_routines_once()
 
         await self.restart_routines_task()
+        self.metrics.start_writing()
+        if CST.ARCHIVING_SWEEP_ENABLED:
+            self.archivingSweeper.start()
+        if self.startupProfile.timeToReady is None:
+            self.startupProfile.mark_ready()
+            await self.load_deferred_cogs()
+            self.log(f"startup profile: {self.startupProfile.report()}")
         # await self.reset_archiving_timer()
 
+    # A club whose tracking channel can't be read mustn't keep the others from getting their
+    # polls: its directory will be built again when needed.
+    async def build_tracking_directory(self, club):
+        try:
+            await club.trackingDirectory.ensure_built()
+        except Exception as e:
+            club.log(f"couldn't build the tracking directory: {e!r}")
+
     # ----------poll routine functions-------------
 
-    def add_routine(self, routine):
-        self.routines.append(routine)
+    # Add a routine to the given club, the default one if None.
+    def add_routine(self, routine, club=None):
+        (self.clubs.default() if club is None else club).add_routine(routine)
         return self
 
-    async def set_routines_trigger_time(self, triggerTime):
-        self.routinesTriggerTime = triggerTime
-        await self.restart_routines_task()
+    def add_club(self, club):
+        self.clubs.add(club)
         return self
 
-    def get_next_trigger_date(self):
-        now = datetime.datetime.now(tz=CST.USER_TIMEZONE)
-        triggerDate = datetime.datetime.combine(now, self.routinesTriggerTime, tzinfo=CST.USER_TIMEZONE)
-        # If the trigger time has passed for today, consider tomorrow's trigger time.
-        if triggerDate < now:
-            triggerDate += datetime.timedelta(days=1)
-        return triggerDate
-
-    def get_time_until_routines_trigger(self):
-        return self.get_next_trigger_date() - datetime.datetime.now(tz=CST.USER_TIMEZONE)
-
+    # Schedule every routine again, and start the scheduler if it's not running.
     async def restart_routines_task(self):
-        if self.routinesTask is not None:
-            self.routinesTask.cancel()
-        self.log("restarting routines task")
-        self.routinesTask = self.loop.create_task(self.run_routines())
-
-    async def run_routines(self):
-
-        await self.wait_until_ready()
+        self.log("restarting routines scheduler")
+        self.scheduler.schedule_all()
+        self.scheduler.start()
+
+    # Execute the given routines (all of them by default), concurrently. A routine
+    # failing doesn't prevent the others from being executed.
+    async def run_routines_once(self, routines=None):
+        with self.metrics.measure('run_routines_once'):
+            routines = self.clubs.routines() if routines is None else routines
+            self.log(f"executing routines: {', '.join(routine.name for routine in routines)}")
+            self.lastRoutinesTriggerDate = datetime.datetime.now(tz=CST.USER_TIMEZONE)
+
+            semaphore = asyncio.Semaphore(CST.ROUTINES_CONCURRENCY)
+            reports = await asyncio.gather(*[self.execute_routine(routine, semaphore) for routine in routines])
+            self.log(f"routines executed: {', '.join(reports)}")
+
+            # await self.reset_archiving_timer()
+            await self.save_state()
+
+    # Execute the given routine, and get a report of its execution.
+    async def execute_routine(self, routine, semaphore):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                # Timed per routine in the metrics.
+                with self.metrics.measure(f"routine {routine.name}"):
+                    await routine.execute()
+            except Exception as e:
+                self.log(f"routine {routine.name} failed: {e!r}")
+                traceback.print_exc()
+                return f"{routine.name} failed after {time.perf_counter() - start:.2f}s"
+            return f"{routine.name} in {time.perf_counter() - start:.2f}s"
 
-        self.routinesTaskStartTime = datetime.datetime.now(tz=CST.USER_TIMEZONE)
-
-        while not self.is_closed():
-
-            waitDuration = self.get_time_until_routines_trigger().seconds
-
-            self.log(f"waiting until {self.routinesTriggerTime}")
-
-            # Wait until the next trigger time, while checking in regularly
-            # to avoid a bug with asyncio, that makes a wait never end, when
-            # it's longer than 24 hours.
-            while waitDuration > 0:
-                timeUntilNextCheckin = min(waitDuration, CST.MAX_SLEEP_DURATION)
-                await asyncio.sleep(timeUntilNextCheckin)
-                waitDuration -= timeUntilNextCheckin
+    def log(self, msg):
+        print(f"[bot] {msg}")
 
-            await self.run_routines_once()
+    async def close(self):
+        # Persist the votes that are still only in memory before disconnecting.
+        self.scheduler.stop()
+        self.archivingSweeper.stop()
+        if self.pollWorker is not None:
+            await self.pollWorker.close()
+        if self.eventQueue is not None:
+            await self.eventQueue.close()
+        for club in self.clubs:
+            await club.pollStore.close()
+            await club.voteLog.close()
+        await self.param.flush(self)
+        await self.outbound.close()
+        self.param.close()
+        try:
+            self.metrics.write_file()
+        except OSError as e:
+            self.log(f"couldn't write the metrics file: {e}")
+        await super().close()
 
-            # This is to ensure not to spam routines during the second
-            # that is just right on the trigger time.
-            await asyncio.sleep(1)
+    # ---------------commands instrumentation----------
 
-    async def run_routines_once(self):
+    async def invoke(self, ctx):
+        if ctx.command is None:
+            await super().invoke(ctx)
+        else:
+            with self.metrics.measure(f"command {ctx.command.qualified_name}"):
+                await super().invoke(ctx)
 
-        self.log("executing routines")
-        self.lastRoutinesTriggerDate = datetime.datetime.now(tz=CST.USER_TIMEZONE)
+    async def invoke_application_command(self, ctx):
+        with self.metrics.measure(f"command /{ctx.command.qualified_name}"):
+            await super().invoke_application_command(ctx)
 
-        for routine in self.routines:
-            await routine.execute()
+    async def on_command_error(self, ctx, error):
+        if ctx.command is not None:
+            self.metrics.count_error(f"command {ctx.command.qualified_name}")
+        await super().on_command_error(ctx, error)
 
-        # await self.reset_archiving_timer()
-        await self.save_state()
-
-    def log(self, msg):
-        print(f"[bot] {msg}")
+    async def on_application_command_error(self, ctx, error):
+        self.metrics.count_error(f"command /{ctx.command.qualified_name}")
+        await super().on_application_command_error(ctx, error)
 
     # ---------------reset thread archiving timers----------
     # this version of the function reset the thread timers for all threads in the server.
+    # Reset the archiving timer of the threads close to be archived, see ArchivingSweeper.
     async def reset_archiving_timer(self):
-        for guild in self.guilds:
-            for channel in guild.channels:
-                if channel.type.name == 'text':
-                    for thread in channel.threads:
-                        if thread.auto_archive_duration != 60:
-                            try:
-                                if not thread.archived:
-                                    await thread.edit(auto_archive_duration=60)
-                                    await thread.edit(auto_archive_duration=CST.MAX_THREAD_ARCHIVING_DURATION)
-                            except:
-                                pass
+        return await self.archivingSweeper.sweep()
 
 
     # this version of the function reset the thread timers for threads in self.noArchivingChannels and self.protectedThreads.
@@ -198,51 +280,68 @@ class TheBot(commands.Bot):
     # ----------------bot startup config --------------
 
     async def load_state_and_config(self):
-        botStateStr, botConfigStr = await self.param.load_param_msgs(self)
-        self.param.state.read_string(botStateStr)
-        self.param.config.read_string(botConfigStr)
+        await self.param.load(self)
 
-        self.canceledTrainings = {} if not self.param.state.has_section('canceled_trainings') \
-            else json.loads(self.param.state['canceled_trainings'].get('dates'))
+        for club in self.clubs:
+            section = club.get_state_prefix() + 'canceled_trainings'
+            club.canceledTrainings = {} if not self.param.state.has_section(section) \
+                else json.loads(self.param.state[section].get('dates'))
         # self.canceledTrainings = [] if not self.param.config.has_section('canceled_trainings') \
         #     else self.param.config['canceled_trainings'].get('dates').split()
 
+        # Before each club had its own, the routines trigger time was the bot's one.
+        legacyTriggerTime = self.param.state['bot'].gettime('routinesTriggerTime') \
+            if self.param.state.has_section('bot') else None
+        for club in self.clubs:
+            section = club.get_state_section()
+            if self.param.state.has_section(section):
+                club.routinesTriggerTime = self.param.state[section].gettime('routinesTriggerTime')
+            elif legacyTriggerTime is not None:
+                club.routinesTriggerTime = legacyTriggerTime
+
         if self.param.state.has_section('bot'):
             botStateConfig = self.param.state['bot']
-            self.routinesTriggerTime = botStateConfig.gettime('routinesTriggerTime')
             self.lastRoutinesTriggerDate = botStateConfig.getdatetime('lastRoutinesTriggerDate')
             # self.protectedThreads = [] if botStateConfig.get('protectedThreads') is None \
             #     else list(map(int, botStateConfig.get('protectedThreads').split()))
             # self.noArchivingChannels = [] if botStateConfig.get('noArchivingChannels') is None \
             #     else list(map(int, botStateConfig.get('noArchivingChannels').split()))
 
-            for routine in self.routines:
+            for routine in self.clubs.routines():
                 routine.load_routines_state(self.param.state)
 
+    # Update the state with the bot's current one. Only the sections that changed are saved,
+    # and the saves requested within a short delay are grouped into a single write.
     async def save_state(self):
-        self.param.state['bot'] = \
-            {
-                'routinesTriggerTime':
-                    "" if self.routinesTriggerTime is None
-                    else self.routinesTriggerTime.isoformat(),
-                'lastRoutinesTriggerDate':
-                    "" if self.lastRoutinesTriggerDate is None
-                    else self.lastRoutinesTriggerDate.isoformat(),
-                # 'protectedThreads':
-                #     "" if self.protectedThreads is None
-                #     else ' '.join(map(str, self.protectedThreads)),
-                # 'noArchivingChannels':
-                #     "" if self.noArchivingChannels is None
-                #     else ' '.join(map(str, self.noArchivingChannels)),
-            }
-
-        self.param.state['canceled_trainings'] = {
-            'dates': {} if self.canceledTrainings is None else json.dumps(self.canceledTrainings)
-        }
-
-        for routine in self.routines:
-            routine.save_routines_state(self.param.state)
-        await self.param.write_state(self)
+        with self.metrics.measure('save_state'):
+            sections = {}
+            sections['bot'] = \
+                {
+                    'lastRoutinesTriggerDate':
+                        "" if self.lastRoutinesTriggerDate is None
+                        else self.lastRoutinesTriggerDate.isoformat(),
+                    # 'protectedThreads':
+                    #     "" if self.protectedThreads is None
+                    #     else ' '.join(map(str, self.protectedThreads)),
+                    # 'noArchivingChannels':
+                    #     "" if self.noArchivingChannels is None
+                    #     else ' '.join(map(str, self.noArchivingChannels)),
+                }
+
+            for club in self.clubs:
+                sections[club.get_state_section()] = {
+                    'routinesTriggerTime':
+                        "" if club.routinesTriggerTime is None
+                        else club.routinesTriggerTime.isoformat(),
+                }
+                sections[club.get_state_prefix() + 'canceled_trainings'] = {
+                    'dates': {} if club.canceledTrainings is None else json.dumps(club.canceledTrainings)
+                }
+
+            for routine in self.clubs.routines():
+                routine.save_routines_state(sections)
+            self.param.update_state(sections)
+            self.param.save_later(self)
 
 
 # Parser of the bot's state. Allows to save and restore its state after a reboot.
@@ -292,8 +391,92 @@ class BotParameters:
         self.paramMessages = {}
         self.stateHeader = ""
         self.configHeader = ""
+        # Primary store of the state. If None, the state message is the only store.
+        self.store = None if CST.STATE_DB_PATH is None else SqliteStateStore(CST.STATE_DB_PATH)
+        self.paramMsgsTask = None
+        # Sections of the state changed since the last save.
+        self.dirtySections = set()
+        self.saver = DebouncedFlush(self.save)
+
+    # Load the state from the local store if it has one, else from the state message.
+    async def load(self, bot):
+        if self.store is not None and self.store.read(self.state):
+            # The param messages are then only needed for the config and the Discord
+            # mirror of the state, so they're read in the background.
+            self.load_param_msgs_later(bot)
+        else:
+            self.paramMsgsTask = bot.loop.create_task(self.load_param_msgs(bot))
+            botStateStr, botConfigStr = await self.paramMsgsTask
+            self.state.read_string(botStateStr)
+            self.config.read_string(botConfigStr)
+            if self.store is not None:
+                self.store.write(self.state)
+
+    # Read the param messages in the background, then the config from them.
+    def load_param_msgs_later(self, bot):
+        self.paramMsgsTask = bot.loop.create_task(self.load_param_msgs(bot))
+        self.paramMsgsTask.add_done_callback(self.__read_config)
+
+    def __read_config(self, task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            # Read again by the next mirror of the state.
+            print(f"[bot] couldn't read the config channel: {task.exception()!r}")
+        else:
+            self.config.read_string(task.result()[1])
+
+    # Replace the given sections of the state ({section: {key: value}}),
+    # and mark the ones whose content changed as dirty.
+    def update_state(self, sections):
+        for section, values in sections.items():
+            values = {self.state.optionxform(key): str(value) for key, value in values.items()}
+            if not self.state.has_section(section) or dict(self.state.items(section, raw=True)) != values:
+                self.state[section] = values
+                self.dirtySections.add(section)
+
+    # Save the dirty sections after a delay, along with the ones that change meanwhile.
+    def save_later(self, bot, delay=CST.STATE_SAVE_DELAY):
+        if self.dirtySections:
+            self.saver.schedule(delay, bot)
+
+    # Save the dirty sections now, for ex. before disconnecting.
+    async def flush(self, bot):
+        await self.saver.flush(bot)
+
+    # Save the dirty sections in the local store, and mirror the state to the state message in the background.
+    async def save(self, bot):
+        if not self.dirtySections:
+            return
+        dirtySections = self.dirtySections
+        self.dirtySections = set()
+        try:
+            if self.store is None:
+                await self.write_state(bot)
+                return
+            self.store.write(self.state, dirtySections)
+        except (sqlite3.Error, discord.HTTPException) as e:
+            # Retried on the next save.
+            print(f"[bot] couldn't save the state: {e}")
+            self.dirtySections |= dirtySections
+            return
+        if CST.STATE_DISCORD_MIRROR:
+            # Mirrors requested while one is pending are coalesced, since it writes the latest state.
+            bot.outbound.submit(self.write_state, bot, priority=outbound.LOW,
+                                route=('edit_message', CST.CONFIG_CHANNEL_ID), key=('state_mirror',))
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
 
     async def write_state(self, bot):
+        # The state message must be known before writing it.
+        if self.paramMsgsTask is not None:
+            if self.paramMsgsTask.done() and (self.paramMsgsTask.cancelled()
+                                              or self.paramMsgsTask.exception() is not None):
+                # The previous read failed, it would fail every mirror until the bot restarts.
+                self.load_param_msgs_later(bot)
+            await self.paramMsgsTask
 
         buf = io.StringIO("")
         self.state.write(buf)  # utilisation d'un buffer car la methode write() de configParser
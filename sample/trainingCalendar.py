@@ -0,0 +1,55 @@
+import collections
+import datetime
+import functools
+
+import constants as CST
+
+# A training date, with its title as displayed in the polls (ex: "Lundi 3 octobre"),
+# and its key in the canceled trainings (ex: "03/10").
+TrainingDate = collections.namedtuple('TrainingDate', ['date', 'title', 'key'])
+
+
+# Calendar of the dates of the trainings on a given week day. The dates of the season
+# (ie. the next weeks, up to the horizon) are formatted once, on first use, and the
+# calendar is extended when a date past the horizon is requested.
+class TrainingCalendar:
+
+    def __init__(self, weekDayNum, horizonWeeks=CST.TRAINING_CALENDAR_WEEKS):
+        self.weekDayNum = weekDayNum
+        self.horizonWeeks = horizonWeeks
+        # date -> TrainingDate
+        self.trainingDates = {}
+
+    # Get the next training from the given reference date (today if None), this date included.
+    def next_training(self, refDate=None):
+        if refDate is None:
+            refDate = datetime.datetime.now(tz=CST.USER_TIMEZONE)
+        date = refDate.date() if isinstance(refDate, datetime.datetime) else refDate
+        date += datetime.timedelta(days=(self.weekDayNum - date.weekday()) % 7)
+        trainingDate = self.trainingDates.get(date)
+        if trainingDate is None:
+            self.__compute(date)
+            trainingDate = self.trainingDates[date]
+        return trainingDate
+
+    # Compute the training dates from the given one up to the horizon, dropping the past ones.
+    def __compute(self, fromDate):
+        # Imported on first use, since Babel takes long to import and isn't needed to be ready.
+        import babel.dates
+        self.trainingDates = {date: trainingDate for date, trainingDate in self.trainingDates.items()
+                              if date >= fromDate}
+        for week in range(self.horizonWeeks):
+            date = fromDate + datetime.timedelta(weeks=week)
+            if date not in self.trainingDates:
+                self.trainingDates[date] = TrainingDate(
+                    date, babel.dates.format_date(date, format='EEEE d MMMM', locale='fr_FR').capitalize(),
+                    date.strftime("%d/%m"))
+
+
+# Get the English name of the given week day number (ex: "Monday" for 0).
+@functools.lru_cache(maxsize=None)
+def get_weekday_name(weekDayNum):
+    import babel.dates
+    # Any date on this week day.
+    date = datetime.date(2024, 1, 1) + datetime.timedelta(days=weekDayNum)
+    return babel.dates.format_date(date, format='EEEE', locale='en')
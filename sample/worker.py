@@ -0,0 +1,141 @@
+import asyncio
+import signal
+import traceback
+
+import discord
+import constants as CST
+from eventQueue import SqliteEventQueue
+from poll import handleVote, handleTrainingThreadMessage
+
+
+# Member who voted, as given by the gateway event, so that the worker doesn't have to fetch it.
+class EventMember:
+
+    def __init__(self, id, name, nick):
+        self.id = id
+        self.name = name
+        self.nick = nick
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+
+# Worker handling the events of a partition of the event queue, pushed by the gateway
+# process. The events are fetched in the order they were pushed, and handled concurrently
+# except for the votes of a member on the same poll, which are handled one at a time, in order.
+class PollWorker:
+
+    def __init__(self, bot, queue, partition, pollInterval=CST.EVENT_QUEUE_POLL_INTERVAL,
+                 batchSize=CST.EVENT_QUEUE_BATCH):
+        self.bot = bot
+        self.queue = queue
+        self.partition = partition
+        self.pollInterval = pollInterval
+        # Maximum number of events handled at the same time.
+        self.batchSize = batchSize
+        # Id of the last event fetched. The events fetched but not acknowledged yet
+        # are in progress, and are fetched again only if the worker restarts.
+        self.lastId = 0
+        self.tasks = set()
+        self.stopped = False
+        # metrics
+        self.handledCount = 0
+        self.failedCount = 0
+
+    async def run(self):
+        self.log(f"handling partition {self.partition} of {self.queue.partitionCount}")
+        while not self.stopped:
+            if len(self.tasks) >= self.batchSize:
+                await asyncio.wait(self.tasks, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            events = self.queue.fetch(self.partition, self.lastId, self.batchSize - len(self.tasks))
+            for eventId, kind, payload in events:
+                self.lastId = eventId
+                task = self.bot.loop.create_task(self.handle(eventId, kind, payload))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            if not events:
+                await asyncio.sleep(self.pollInterval)
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def handle(self, eventId, kind, payload):
+        if kind == 'member_invalidate':
+            self.bot.resolver.members.invalidate(payload['guild_id'], payload['user_id'])
+            await self.queue.ack(eventId)
+            return
+        if kind == 'vote':
+            club = self.bot.clubs.for_channel(payload['channel_id'])
+        else:
+            club = self.bot.clubs.for_channel(payload['parent_id'])
+        if club is None:
+            self.log(f"no club for the {kind} event {eventId}, ignored")
+        elif kind == 'vote':
+            # Taken before any await: the tasks are started in the events' order, and
+            # the lock is then given in the order it was requested.
+            async with club.pollStore.lock((payload['message_id'], payload['user_id'])):
+                await self.__measure(club, kind, payload)
+        else:
+            await self.__measure(club, kind, payload)
+        await self.queue.ack(eventId)
+
+    async def __measure(self, club, kind, payload):
+        try:
+            with self.bot.metrics.measure(f"worker {kind}"):
+                await self.__handle(club, kind, payload)
+            self.handledCount += 1
+        except Exception:
+            # Not handled again, as it would most likely fail the same way.
+            self.failedCount += 1
+            traceback.print_exc()
+
+    async def __handle(self, club, kind, payload):
+        if kind == 'vote':
+            member = payload['member']
+            if member is not None:
+                member = EventMember(payload['user_id'], member['name'], member['nick'])
+            await handleVote(self.bot, club, payload['guild_id'], payload['channel_id'], payload['message_id'],
+                             payload['user_id'], discord.PartialEmoji.from_str(payload['emoji']), member)
+        elif kind == 'thread_message':
+            await handleTrainingThreadMessage(self.bot, club, payload['guild_id'], payload['thread_id'],
+                                              payload['thread_name'])
+        else:
+            self.log(f"unknown event kind {kind}")
+
+    def stop(self):
+        self.stopped = True
+
+    # Stop fetching events, and wait for the ones in progress to be handled.
+    async def close(self):
+        self.stop()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.queue.close()
+
+    def stats(self):
+        return {'partition': self.partition, 'in_progress': len(self.tasks),
+                'handled': self.handledCount, 'failed': self.failedCount}
+
+    def log(self, msg):
+        print(f"[worker {self.partition}] {msg}")
+
+
+# Run the given bot as the worker of the given partition, until it receives SIGTERM or SIGINT.
+# It only logs in to use the REST API: it never connects to the gateway, so its routines
+# and commands don't run, these being the gateway process' ones.
+def run_worker(bot, token, partition, queue=None):
+    queue = SqliteEventQueue() if queue is None else queue
+    bot.pollWorker = PollWorker(bot, queue, partition)
+    bot.metrics.filePath = f"metrics.worker{partition}.prom"
+    loop = bot.loop
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, bot.pollWorker.stop)
+
+    async def runner():
+        try:
+            await bot.login(token)
+            bot.metrics.start_writing()
+            await bot.pollWorker.run()
+        finally:
+            await bot.close()
+
+    loop.run_until_complete(runner())
@@ -0,0 +1,159 @@
+# Reaction storm load test: members vote ✅/❌ on the polls sent by training poll routines,
+# against the fake Discord server, and the handlers' latency and the number of REST calls
+# per vote are reported. It runs fully offline, for ex.:
+#     python test/benchmark.py --members 40 --polls 3 --latency 0.05
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from fakeDiscord import FakeDiscord
+import constants as CST
+import poll
+from outbound import percentile
+from eventQueue import SqliteEventQueue
+from worker import PollWorker
+
+
+async def run_benchmark(args):
+    rateLimit = (args.rate_limit, args.rate_period) if args.rate_limit else None
+    world = FakeDiscord(latency=args.latency, rateLimit=rateLimit).create_bot_channels()
+    members = [world.guild.add_member(f"membre{i}", nick=f"Membre {i}" if i % 2 else None)
+               for i in range(args.members)]
+    bot = world.create_bot()
+    club = bot.clubs.default()
+    club.pollStore.flushInterval = args.flush_interval
+    await club.trackingDirectory.ensure_built()
+
+    # Send the polls as the routines do on their execution day.
+    pollsChannel = world.channels[CST.TRAINING_POLLS_CHANNEL_ID]
+    today = datetime.datetime.now(tz=CST.USER_TIMEZONE).weekday()
+    for trainingDayNum in [0, 2, 5, 1, 3, 4, 6][:args.polls]:
+        routine = poll.TrainingPollRoutine(f"bench_poll_{trainingDayNum}", f"Bench poll {trainingDayNum}", bot,
+                                           poll.TrainingPollMsgBuilder(trainingDayNum, "benchmark", ["✅", "❌"],
+                                                                       0x31B404, "fil de l'entraînement"),
+                                           str(trainingDayNum))
+        bot.add_routine(routine)
+        routine.enable(today, CST.TRAINING_POLLS_CHANNEL_ID)
+        await routine.execute()
+    pollMsgs = list(pollsChannel.messages)
+
+    # In the split mode, the bot only pushes the poll events onto the queue, and
+    # worker bots (in this process, but sharing nothing else) handle them.
+    workerBots = []
+    if args.workers:
+        queuePath = os.path.join(tempfile.mkdtemp(), 'events.sqlite3')
+        bot.eventQueue = SqliteEventQueue(queuePath, args.workers)
+        for partition in range(args.workers):
+            workerBot = world.create_bot(gatewayCache=False)
+            workerBot.clubs.default().pollStore.flushInterval = args.flush_interval
+            workerBot.pollWorker = PollWorker(workerBot, SqliteEventQueue(queuePath, args.workers), partition)
+            workerBots.append(workerBot)
+        # The gateway events are dispatched to the bot.
+        world.bot = bot
+        workerTasks = [asyncio.create_task(workerBot.pollWorker.run()) for workerBot in workerBots]
+
+    # Every member votes on every poll at a random time of the window, some of them
+    # changing their mind, and some messages are posted in the training threads.
+    rng = random.Random(args.seed)
+    events = []
+    expected = {pollMsg.id: set() for pollMsg in pollMsgs}
+    for pollMsg in pollMsgs:
+        for member in members:
+            votes = ["✅"] if rng.random() < args.yes_ratio else ["❌"]
+            if rng.random() < args.change_ratio:
+                votes.append("❌" if votes[0] == "✅" else "✅")
+            start = rng.uniform(0, args.window)
+            for i, emoji in enumerate(votes):
+                events.append((start + i * 0.001, 'vote', pollMsg, member, emoji))
+            if votes[-1] == "✅":
+                expected[pollMsg.id].add(member.id)
+        for _ in range(args.messages):
+            events.append((rng.uniform(0, args.window), 'message', pollMsg, rng.choice(members), None))
+    events.sort(key=lambda event: event[0])
+
+    latencies = {'vote': [], 'message': []}
+    world.restCalls.clear()
+
+    async def replay(delay, kind, pollMsg, member, emoji):
+        await asyncio.sleep(delay)
+        start = time.perf_counter()
+        if kind == 'vote':
+            await bot.on_raw_reaction_add(pollMsg.user_react(member, emoji))
+        else:
+            thread = world.guild.get_thread(pollMsg.id)
+            await bot.on_message(thread.post(member, "on se retrouve à quelle heure ?", dispatch=False))
+        latencies[kind].append(time.perf_counter() - start)
+
+    # Events of the same member on the same poll are replayed in order, as the gateway does.
+    phaseStart = time.perf_counter()
+    await asyncio.gather(*[replay(*event) for event in events])
+    handlersDuration = time.perf_counter() - phaseStart
+    pollStores = [club.pollStore]
+    if workerBots:
+        while bot.eventQueue.depth():
+            await asyncio.sleep(0.01)
+        for workerBot in workerBots:
+            workerBot.pollWorker.stop()
+        await asyncio.gather(*workerTasks)
+        for workerBot in workerBots:
+            pollStores.append(workerBot.clubs.default().pollStore)
+            await workerBot.close()
+    # Write the poll data and wait for every queued action to be sent.
+    await club.pollStore.close()
+    await club.voteLog.close()
+    await bot.param.flush(bot)
+    await bot.outbound.close(timeout=None)
+    await bot.close()
+    totalDuration = time.perf_counter() - phaseStart
+
+    voteCount = len(latencies['vote'])
+    polls = {}
+    for pollStore in pollStores:
+        polls.update(pollStore.polls)
+    consistent = all(set(polls[world.guild.get_thread(pollMsg.id).name].members)
+                     == expected[pollMsg.id] for pollMsg in pollMsgs)
+
+    print(f"members: {args.members}, polls: {len(pollMsgs)}, votes: {voteCount}, "
+          f"thread messages: {len(latencies['message'])}, REST latency: {args.latency * 1000:.0f}ms"
+          + (f", workers: {args.workers}" if args.workers else ""))
+    for kind, values in latencies.items():
+        values.sort()
+        if values:
+            print(f"{kind:>8} handler latency: p50 {percentile(values, 0.5) * 1000:.1f}ms, "
+                  f"p99 {percentile(values, 0.99) * 1000:.1f}ms, max {values[-1] * 1000:.1f}ms")
+    print(f"REST calls: {world.total_rest_calls()} ({world.total_rest_calls() / max(voteCount, 1):.2f} per vote), "
+          f"rate limited: {world.rateLimitedCount}")
+    for (handler, route), count in bot.metrics.restCalls.most_common():
+        print(f"\t{handler} {route}: {count}")
+    print(f"handlers done in {handlersDuration:.2f}s, everything written in {totalDuration:.2f}s")
+    print(f"poll data consistent with the votes: {'yes' if consistent else 'NO'}")
+    return consistent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reaction storm load test, against a fake Discord server.")
+    parser.add_argument('--members', type=int, default=40, help="number of voting members")
+    parser.add_argument('--polls', type=int, default=3, help="number of polls (1 to 7)")
+    parser.add_argument('--window', type=float, default=2.0, help="duration over which the votes arrive (s)")
+    parser.add_argument('--messages', type=int, default=10, help="messages posted per training thread")
+    parser.add_argument('--yes-ratio', type=float, default=0.7, help="ratio of ✅ votes")
+    parser.add_argument('--change-ratio', type=float, default=0.1, help="ratio of members changing their vote")
+    parser.add_argument('--latency', type=float, default=0.05, help="duration of a REST call (s)")
+    parser.add_argument('--rate-limit', type=int, default=5, help="calls allowed per route and channel, 0 to disable")
+    parser.add_argument('--rate-period', type=float, default=5.0, help="period of the rate limit (s)")
+    parser.add_argument('--flush-interval', type=float, default=CST.POLL_DATA_FLUSH_INTERVAL,
+                        help="minimum delay between two writes of a poll's data (s)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="number of workers handling the events pushed by the bot, 0 to handle them in the bot")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    consistent = asyncio.run(run_benchmark(args))
+    raise SystemExit(0 if consistent else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,552 @@
+# In-process stand-in for the part of Discord used by the bot (channels, threads,
+# messages, history, reactions, members), with simulated REST latency and rate limits.
+# It allows to run the bot's handlers fully offline, and to count the REST calls they make.
+import asyncio
+import collections
+import datetime
+import itertools
+import os
+import sys
+import tempfile
+import time
+import types
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# The bot's modules import each other as top level modules (see sample/main.py).
+sys.path[0:0] = [ROOT_DIR, os.path.join(ROOT_DIR, 'sample')]
+
+import discord
+import constants as CST
+from metrics import currentHandler
+
+TEXT = types.SimpleNamespace(name='text', value=0)
+PUBLIC_THREAD = types.SimpleNamespace(name='public_thread', value=11)
+
+
+# The fake Discord server: it holds the channels and users, counts the REST calls
+# per route, and dispatches the gateway events to the bot.
+class FakeDiscord:
+
+    def __init__(self, latency=0.0, rateLimit=None):
+        # Duration of every REST call (in seconds).
+        self.latency = latency
+        # (number of calls, period in seconds) allowed per route and channel, as Discord's buckets.
+        self.rateLimit = rateLimit
+        self.restCalls = collections.Counter()
+        self.rateLimitedCount = 0
+        self.buckets = {}
+        self.ids = itertools.count(1000000000000000000)
+        self.bot = None
+        self.channels = {}
+        self.users = {}
+        self.guild = FakeGuild(self)
+        self.botUser = FakeUser(self, self.next_id(), 'ConstantiaBot', bot=True)
+        self.users[self.botUser.id] = self.botUser
+
+    def next_id(self):
+        return next(self.ids)
+
+    # Create the channels the bot expects to find, as set in constants.py.
+    def create_bot_channels(self):
+        for name, channelId in [('paramètres-du-bot', CST.CONFIG_CHANNEL_ID),
+                                ('entraînements', CST.TRAINING_POLLS_CHANNEL_ID),
+                                ('test', CST.TEST_CHANNEL_ID),
+                                ('suivi', CST.TRACKING_CHANNEL_ID)]:
+            self.guild.add_text_channel(name, channelId)
+        return self
+
+    # Create a bot plugged to this fake server, instead of the Discord gateway and API.
+    # Without the gateway cache, as in a worker process, every channel, thread, guild
+    # and member must be fetched.
+    def create_bot(self, gatewayCache=True):
+        import theBot
+
+        world = self
+
+        class FakeBot(theBot.TheBot):
+
+            @property
+            def user(self):
+                return world.botUser
+
+            @property
+            def guilds(self):
+                return [world.guild]
+
+            def get_channel(self, id):
+                return world.channels.get(id) if gatewayCache else None
+
+            def get_guild(self, id):
+                return world.guild if gatewayCache and id == world.guild.id else None
+
+            async def fetch_guild(self, id):
+                await world.rest('get_guild', id)
+                if id != world.guild.id:
+                    raise discord.NotFound(FakeResponse(404), 'Unknown Guild')
+                return FakeFetchedGuild(world.guild)
+
+            async def fetch_channel(self, id):
+                await world.rest('get_channel', id)
+                if id not in world.channels:
+                    raise discord.NotFound(FakeResponse(404), 'Unknown Channel')
+                return world.channels[id]
+
+            async def fetch_user(self, id):
+                await world.rest('get_user')
+                return world.users.get(id) or world.guild.members[id]
+
+            async def process_commands(self, message):
+                pass
+
+        # The cogs are loaded from a path relative to the repository's root.
+        os.chdir(ROOT_DIR)
+        self.bot = FakeBot()
+        self.bot.loop = asyncio.get_running_loop()
+        # The files written by the bot mustn't replace the live bot's ones, in the repository's root.
+        filesDir = tempfile.mkdtemp(prefix='fakeDiscord-')
+        if self.bot.param.store is not None:
+            self.bot.param.store.path = os.path.join(filesDir, os.path.basename(CST.STATE_DB_PATH))
+        self.bot.metrics.filePath = os.path.join(filesDir, os.path.basename(CST.METRICS_FILE_PATH))
+        self.bot.param.stateHeader = "#state#\n#sauvegarde de l'état du bot\n"
+        self.bot.param.configHeader = "#config#"
+        return self.bot
+
+    # Simulate a REST call on the given route, for the given major parameter (channel, guild...).
+    async def rest(self, route, major=None):
+        self.restCalls[route] += 1
+        if self.bot is not None:
+            # As the bot's instrumented HTTP client would.
+            self.bot.metrics.restCalls[(currentHandler.get(), route)] += 1
+        if self.rateLimit is not None:
+            calls, period = self.rateLimit
+            stamps = self.buckets.setdefault((route, major), collections.deque())
+            now = time.perf_counter()
+            while stamps and now - stamps[0] >= period:
+                stamps.popleft()
+            if len(stamps) >= calls:
+                # pycord waits for the bucket to reset, then retries.
+                self.rateLimitedCount += 1
+                await asyncio.sleep(period - (now - stamps[0]))
+                stamps.popleft()
+            stamps.append(time.perf_counter())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def dispatch(self, event, *args):
+        if self.bot is not None:
+            self.bot.dispatch(event, *args)
+
+    def total_rest_calls(self):
+        return sum(self.restCalls.values())
+
+
+# Content of a message as stored by Discord, which trims it.
+def format_content(content):
+    return '' if content is None else str(content).strip()
+
+
+class FakeResponse:
+
+    def __init__(self, status, reason=''):
+        self.status = status
+        self.reason = reason
+
+
+class FakeUser:
+
+    def __init__(self, world, id, name, bot=False):
+        self.world = world
+        self.id = id
+        self.name = name
+        self.bot = bot
+        self.nick = None
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+    @property
+    def display_name(self):
+        return self.nick or self.name
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeMember(FakeUser):
+
+    def __init__(self, world, guild, id, name, nick=None):
+        super().__init__(world, id, name)
+        self.guild = guild
+        self.nick = nick
+
+
+class FakeGuild:
+
+    def __init__(self, world):
+        self.world = world
+        self.id = world.next_id()
+        self.members = {}
+        self.channelsById = {}
+        self.threadsById = {}
+
+    @property
+    def channels(self):
+        return list(self.channelsById.values())
+
+    @property
+    def threads(self):
+        return list(self.threadsById.values())
+
+    def add_member(self, name, nick=None):
+        member = FakeMember(self.world, self, self.world.next_id(), name, nick)
+        self.members[member.id] = member
+        return member
+
+    def add_text_channel(self, name, id=None):
+        channel = FakeTextChannel(self.world, self, name, id)
+        self.channelsById[channel.id] = channel
+        self.world.channels[channel.id] = channel
+        return channel
+
+    def get_member(self, id):
+        return self.members.get(id)
+
+    def get_thread(self, id):
+        return self.threadsById.get(id)
+
+    def get_channel(self, id):
+        return self.channelsById.get(id)
+
+    def get_channel_or_thread(self, id):
+        return self.channelsById.get(id) or self.threadsById.get(id)
+
+    async def fetch_member(self, id):
+        await self.world.rest('get_member', self.id)
+        if id not in self.members:
+            raise discord.NotFound(FakeResponse(404), 'Unknown Member')
+        return self.members[id]
+
+
+# Guild as fetched from the REST API: without its members, channels and threads.
+class FakeFetchedGuild:
+
+    def __init__(self, guild):
+        self.guild = guild
+        self.id = guild.id
+
+    def get_member(self, id):
+        return None
+
+    def get_thread(self, id):
+        return None
+
+    def get_channel(self, id):
+        return None
+
+    async def fetch_member(self, id):
+        return await self.guild.fetch_member(id)
+
+
+class FakeReaction:
+
+    def __init__(self, message, emoji):
+        self.message = message
+        self.emoji = emoji
+        self.userIds = []
+
+    @property
+    def count(self):
+        return len(self.userIds)
+
+    @property
+    def me(self):
+        return self.message.world.botUser.id in self.userIds
+
+    def users(self, limit=None, after=None):
+        return FakeReactionUsers(self, limit, after)
+
+
+# Paginated iterator of the users of a reaction, one REST call per 100 users.
+class FakeReactionUsers:
+
+    def __init__(self, reaction, limit, after):
+        self.reaction = reaction
+        self.limit = limit
+        self.after = after
+
+    async def __aiter__(self):
+        message = self.reaction.message
+        ids = sorted(self.reaction.userIds)
+        if self.after is not None:
+            ids = [userId for userId in ids if userId > self.after.id]
+        if self.limit is not None:
+            ids = ids[:self.limit]
+        for start in range(0, max(len(ids), 1), 100):
+            await message.world.rest('get_reactions', message.channel.id)
+            for userId in ids[start:start + 100]:
+                yield message.world.users.get(userId) or message.guild.get_member(userId)
+
+    async def flatten(self):
+        return [user async for user in self]
+
+
+class FakeMessage:
+
+    def __init__(self, world, channel, author, content=None, embed=None):
+        self.world = world
+        self.id = world.next_id()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = format_content(content)
+        self.embeds = [] if embed is None else [embed]
+        self.reactions = []
+        self.pinned = False
+        self.pinnedAt = None
+        self.reference = None
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+
+    async def edit(self, content=discord.utils.MISSING, **kwargs):
+        await self.world.rest('edit_message', self.channel.id)
+        if content is not discord.utils.MISSING:
+            self.content = format_content(content)
+        if 'embed' in kwargs:
+            self.embeds = [] if kwargs['embed'] is None else [kwargs['embed']]
+        return self
+
+    async def delete(self, delay=None):
+        await self.world.rest('delete_message', self.channel.id)
+        self.channel.remove_message(self)
+
+    async def pin(self, reason=None):
+        await self.world.rest('pin_message', self.channel.id)
+        self.pinned = True
+        self.pinnedAt = datetime.datetime.now(datetime.timezone.utc)
+
+    async def unpin(self, reason=None):
+        await self.world.rest('unpin_message', self.channel.id)
+        self.pinned = False
+
+    def get_reaction(self, emoji, create=False):
+        for reaction in self.reactions:
+            if str(reaction.emoji) == str(emoji):
+                return reaction
+        if create:
+            reaction = FakeReaction(self, emoji)
+            self.reactions.append(reaction)
+            return reaction
+
+    async def add_reaction(self, emoji):
+        await self.world.rest('add_reaction', self.channel.id)
+        reaction = self.get_reaction(emoji, create=True)
+        if self.world.botUser.id not in reaction.userIds:
+            reaction.userIds.append(self.world.botUser.id)
+
+    async def remove_reaction(self, emoji, member):
+        await self.world.rest('remove_reaction', self.channel.id)
+        reaction = self.get_reaction(emoji)
+        if reaction is not None and member.id in reaction.userIds:
+            reaction.userIds.remove(member.id)
+            if not reaction.userIds:
+                self.reactions.remove(reaction)
+
+    async def create_thread(self, name, auto_archive_duration=None):
+        await self.world.rest('create_thread', self.channel.id)
+        thread = FakeThread(self.world, self.channel, name, self.id, auto_archive_duration)
+        self.world.dispatch('thread_create', thread)
+        return thread
+
+    # Simulate a member reacting to this message, and get the payload of the gateway event.
+    def user_react(self, member, emoji):
+        reaction = self.get_reaction(emoji, create=True)
+        if member.id not in reaction.userIds:
+            reaction.userIds.append(member.id)
+        return types.SimpleNamespace(user_id=member.id, member=member, channel_id=self.channel.id,
+                                     message_id=self.id, guild_id=self.guild.id,
+                                     emoji=discord.PartialEmoji(name=emoji), event_type='REACTION_ADD')
+
+
+class FakePartialMessage:
+
+    def __init__(self, channel, id):
+        self.world = channel.world
+        self.channel = channel
+        self.id = id
+
+    async def remove_reaction(self, emoji, member):
+        message = self.channel.messagesById.get(self.id)
+        if message is None:
+            await self.world.rest('remove_reaction', self.channel.id)
+            raise discord.NotFound(FakeResponse(404), 'Unknown Message')
+        await message.remove_reaction(emoji, member)
+
+    async def add_reaction(self, emoji):
+        await self.channel.messagesById[self.id].add_reaction(emoji)
+
+    async def edit(self, content=discord.utils.MISSING, **kwargs):
+        return await self.channel.messagesById[self.id].edit(content, **kwargs)
+
+    async def delete(self, delay=None):
+        await self.channel.messagesById[self.id].delete()
+
+
+# Paginated iterator of a channel's history, one REST call per 100 messages.
+class FakeHistory:
+
+    def __init__(self, channel, limit, oldest_first, before, after):
+        self.channel = channel
+        self.limit = limit
+        self.oldest_first = oldest_first
+        self.before = before
+        self.after = after
+
+    async def __aiter__(self):
+        messages = list(self.channel.messages)
+        if self.before is not None:
+            messages = [message for message in messages if message.id < self.before.id]
+        if self.after is not None:
+            messages = [message for message in messages if message.id > self.after.id]
+        if not self.oldest_first:
+            messages.reverse()
+        if self.limit is not None:
+            messages = messages[:self.limit]
+        for start in range(0, max(len(messages), 1), 100):
+            await self.channel.world.rest('history', self.channel.id)
+            for message in messages[start:start + 100]:
+                yield message
+
+    async def flatten(self):
+        return [message async for message in self]
+
+
+# Pinned messages of a channel, the most recently pinned first, as pycord's MessagePinIterator.
+class FakePins:
+
+    def __init__(self, channel, limit):
+        self.channel = channel
+        self.limit = limit
+
+    async def __aiter__(self):
+        await self.channel.world.rest('pins', self.channel.id)
+        pinned = sorted((message for message in self.channel.messages if message.pinned),
+                        key=lambda message: message.pinnedAt, reverse=True)
+        for message in pinned[:self.limit]:
+            yield types.SimpleNamespace(message=message, pinned_at=message.pinnedAt)
+
+    async def flatten(self):
+        return [pin async for pin in self]
+
+
+class FakeTextChannel:
+    type = TEXT
+
+    def __init__(self, world, guild, name, id=None):
+        self.world = world
+        self.guild = guild
+        self.name = name
+        self.id = world.next_id() if id is None else id
+        self.messages = []
+        self.messagesById = {}
+        self.threadsById = {}
+
+    @property
+    def threads(self):
+        return list(self.threadsById.values())
+
+    @property
+    def mention(self):
+        return f"<#{self.id}>"
+
+    # Post a message as the given author, as if it was received through the gateway.
+    def post(self, author, content=None, embed=None, dispatch=True):
+        message = FakeMessage(self.world, self, author, content, embed)
+        self.messages.append(message)
+        self.messagesById[message.id] = message
+        if dispatch:
+            self.world.dispatch('message', message)
+        return message
+
+    def remove_message(self, message):
+        if self.messagesById.pop(message.id, None) is not None:
+            self.messages.remove(message)
+            self.world.dispatch('raw_message_delete', types.SimpleNamespace(
+                message_id=message.id, channel_id=self.id, guild_id=self.guild.id, cached_message=message))
+
+    async def send(self, content=None, embed=None, **kwargs):
+        await self.world.rest('send_message', self.id)
+        if content is not None and len(str(content)) > 2000:
+            raise discord.HTTPException(FakeResponse(400), 'Must be 2000 or fewer in length.')
+        return self.post(self.world.botUser, content, embed)
+
+    async def fetch_message(self, id):
+        await self.world.rest('get_message', self.id)
+        if id not in self.messagesById:
+            raise discord.NotFound(FakeResponse(404), 'Unknown Message')
+        return self.messagesById[id]
+
+    def get_partial_message(self, id):
+        return FakePartialMessage(self, id)
+
+    def history(self, limit=100, before=None, after=None, oldest_first=None):
+        return FakeHistory(self, limit, bool(oldest_first), before, after)
+
+    def pins(self, limit=50, before=None):
+        return FakePins(self, limit)
+
+    async def delete_messages(self, messages):
+        messages = list(messages)
+        if len(messages) > 100:
+            raise discord.HTTPException(FakeResponse(400), 'Must be between 2 and 100 messages.')
+        await self.world.rest('bulk_delete', self.id)
+        for message in messages:
+            message = self.messagesById.get(message.id)
+            if message is not None:
+                self.remove_message(message)
+
+
+class FakeThread(FakeTextChannel):
+    type = PUBLIC_THREAD
+
+    def __init__(self, world, parent, name, id, auto_archive_duration=None):
+        super().__init__(world, parent.guild, name, id)
+        self.parent = parent
+        self.parent_id = parent.id
+        self.archived = False
+        self.auto_archive_duration = auto_archive_duration or 1440
+        self.archive_timestamp = datetime.datetime.now(datetime.timezone.utc)
+        # Ids of the members of the thread, ie. the ones that were mentioned in it.
+        self.memberIds = set()
+        parent.threadsById[id] = self
+        parent.guild.threadsById[id] = self
+        world.channels[id] = self
+
+    def post(self, author, content=None, embed=None, dispatch=True):
+        message = super().post(author, content, embed, dispatch)
+        for part in message.content.split('<@')[1:]:
+            userId = part.split('>')[0]
+            if userId.isdigit():
+                self.memberIds.add(int(userId))
+        return message
+
+    async def edit(self, **kwargs):
+        await self.world.rest('edit_channel', self.id)
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+        self.archive_timestamp = datetime.datetime.now(datetime.timezone.utc)
+        return self
+
+    async def delete(self):
+        await self.world.rest('delete_channel', self.id)
+        self.parent.threadsById.pop(self.id, None)
+        self.guild.threadsById.pop(self.id, None)
+        self.world.channels.pop(self.id, None)
+        self.world.dispatch('raw_thread_delete', types.SimpleNamespace(
+            thread_id=self.id, parent_id=self.parent_id, guild_id=self.guild.id, thread=self))
+
+    async def add_user(self, user):
+        await self.world.rest('add_thread_member', self.id)
+        self.memberIds.add(user.id)
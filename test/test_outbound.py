@@ -0,0 +1,81 @@
+# Ordering and coalescing of the outbound queue, run with: python -m pytest test/test_outbound.py
+import asyncio
+import os
+import sys
+import types
+import unittest
+from unittest import mock
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[0:0] = [ROOT_DIR, os.path.join(ROOT_DIR, 'sample'), os.path.join(ROOT_DIR, 'test')]
+
+import discord
+import constants as CST
+from fakeDiscord import FakeResponse
+from outbound import OutboundQueue, LOW
+
+
+class OutboundQueueTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.outbound = OutboundQueue(types.SimpleNamespace(loop=asyncio.get_running_loop()), concurrency=2)
+        self.executed = []
+
+    async def asyncTearDown(self):
+        await self.outbound.close()
+
+    # Action recording its name once executed, rate limited the given number of times first.
+    def action(self, name, rateLimits=0):
+        async def execute():
+            nonlocal rateLimits
+            if rateLimits:
+                rateLimits -= 1
+                raise discord.HTTPException(FakeResponse(429), 'You are being rate limited.')
+            self.executed.append(name)
+            return name
+        return execute
+
+    @mock.patch.object(CST, 'OUTBOUND_RATE_LIMIT_BACKOFF', 0.05)
+    async def test_route_order_after_rate_limit(self):
+        route = ('reaction', 1)
+        futures = [self.outbound.submit(self.action("A", rateLimits=2), route=route),
+                   self.outbound.submit(self.action("B"), route=route),
+                   self.outbound.submit(self.action("C"), route=route)]
+        self.assertEqual(await asyncio.gather(*futures), ["A", "B", "C"])
+        self.assertEqual(self.executed, ["A", "B", "C"])
+
+    @mock.patch.object(CST, 'OUTBOUND_RATE_LIMIT_BACKOFF', 0.05)
+    async def test_other_routes_during_backoff(self):
+        first = self.outbound.submit(self.action("A", rateLimits=1), route=('edit_message', 1))
+        await self.outbound.submit(self.action("B"), route=('edit_message', 2))
+        self.assertEqual(self.executed, ["B"])
+        await first
+        self.assertEqual(self.executed, ["B", "A"])
+
+    @mock.patch.object(CST, 'OUTBOUND_MAX_RETRIES', 1)
+    @mock.patch.object(CST, 'OUTBOUND_RATE_LIMIT_BACKOFF', 0.01)
+    async def test_retries_exhausted(self):
+        with self.assertRaises(discord.HTTPException):
+            await self.outbound.submit(self.action("A", rateLimits=2), route=('edit_message', 1))
+        self.assertEqual(self.outbound.stats()['failed'], 1)
+
+    async def test_key_coalescing(self):
+        key = ('edit_message', 1)
+        first = self.outbound.submit(self.action("edit 1"), route=key, key=key, priority=LOW)
+        second = self.outbound.submit(self.action("edit 2"), route=key, key=key)
+        self.assertEqual(await asyncio.gather(first, second), ["edit 2", "edit 2"])
+        self.assertEqual(self.executed, ["edit 2"])
+        self.assertEqual(self.outbound.stats()['coalesced'], 1)
+        # Not coalesced with an action already done.
+        self.assertEqual(await self.outbound.submit(self.action("edit 3"), route=key, key=key), "edit 3")
+
+    async def test_submit_after_close(self):
+        await self.outbound.submit(self.action("A"))
+        await self.outbound.close()
+        with self.assertRaises(RuntimeError):
+            self.outbound.submit(self.action("B"))
+        self.assertEqual(self.outbound.workers, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
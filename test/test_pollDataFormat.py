@@ -0,0 +1,51 @@
+# Round trips of the poll data format, run with: python -m pytest test/test_pollDataFormat.py
+import os
+import sys
+import unittest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[0:0] = [ROOT_DIR, os.path.join(ROOT_DIR, 'sample')]
+
+import pollDataFormat
+
+MEMBER_IDS = [853998598617432064 + i * 7919 for i in range(300)]
+
+
+class PollDataFormatTest(unittest.TestCase):
+
+    def assertRoundTrip(self, members, idsToAdd, shards):
+        decodedMembers, decodedIdsToAdd = pollDataFormat.decode(shards)
+        self.assertEqual(list(decodedMembers), list(members))
+        self.assertEqual(list(decodedIdsToAdd), list(idsToAdd))
+
+    def test_round_trip(self):
+        members = dict.fromkeys(MEMBER_IDS)
+        idsToAdd = dict.fromkeys(MEMBER_IDS[10:60])
+        shards = pollDataFormat.encode(members, idsToAdd)
+        self.assertGreater(len(shards), 1)
+        self.assertTrue(all(len(shard) <= 2000 for shard in shards))
+        self.assertRoundTrip(members, idsToAdd, shards)
+
+    def test_empty_shards(self):
+        shards = pollDataFormat.encode({}, {}, minShards=3)
+        self.assertEqual(len(shards), 3)
+        self.assertRoundTrip({}, {}, shards)
+        self.assertEqual([pollDataFormat.shard_index(shard) for shard in shards], [0, 1, 2])
+
+    # Discord trims the messages' content.
+    def test_trimmed_shards(self):
+        members = dict.fromkeys(MEMBER_IDS[:3])
+        shards = [shard.strip() for shard in pollDataFormat.encode(members, {}, minShards=2)]
+        self.assertRoundTrip(members, {}, shards)
+        self.assertRoundTrip({}, {}, ["pd1 0 0"])
+
+    def test_legacy(self):
+        content = str({"user_ids_to_add": MEMBER_IDS[:2], "list_of_users": MEMBER_IDS[:5]})
+        self.assertTrue(pollDataFormat.is_legacy(content))
+        self.assertFalse(pollDataFormat.is_shard(content))
+        members, idsToAdd = pollDataFormat.decode_legacy(content)
+        self.assertRoundTrip(members, idsToAdd, pollDataFormat.encode(members, idsToAdd))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# Deadlines of the routines' scheduler, run with: python -m pytest test/test_scheduler.py
+import datetime
+import os
+import sys
+import types
+import unittest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[0:0] = [ROOT_DIR, os.path.join(ROOT_DIR, 'sample')]
+
+import constants as CST
+import poll
+from clubs import Club, ClubRegistry
+from scheduler import RoutineScheduler, get_next_date
+
+MONDAY, SUNDAY = 0, 6
+
+
+# Date at the given wall clock time of the user's time zone.
+def local_date(*args):
+    return datetime.datetime(*args, tzinfo=CST.USER_TIMEZONE)
+
+
+class GetNextDateTest(unittest.TestCase):
+
+    # In 2026, the clocks go forward on March 29 at 2:00, and back on October 25 at 3:00.
+    def test_time_skipped_by_dst(self):
+        nextDate = get_next_date(SUNDAY, datetime.time(2, 30), local_date(2026, 3, 28, 12))
+        self.assertEqual(nextDate, local_date(2026, 3, 29, 3, 30))
+        self.assertEqual(nextDate.utcoffset(), datetime.timedelta(hours=2))
+
+    def test_across_dst_end(self):
+        after = local_date(2026, 10, 23, 9)
+        nextDate = get_next_date(MONDAY, datetime.time(8), after)
+        self.assertEqual((nextDate.date(), nextDate.time()), (datetime.date(2026, 10, 26), datetime.time(8)))
+        self.assertEqual(nextDate.utcoffset(), datetime.timedelta(hours=1))
+        # 71 hours of wall clock time, but 72 actual ones.
+        self.assertEqual(nextDate.timestamp() - after.timestamp(), 72 * 3600)
+
+    def test_same_day(self):
+        self.assertEqual(get_next_date(MONDAY, datetime.time(8), local_date(2026, 10, 19, 7, 59)),
+                         local_date(2026, 10, 19, 8))
+        self.assertEqual(get_next_date(MONDAY, datetime.time(8), local_date(2026, 10, 19, 8)),
+                         local_date(2026, 10, 26, 8))
+
+
+class RoutineDeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bot = types.SimpleNamespace(clubs=ClubRegistry())
+        self.bot.scheduler = RoutineScheduler(self.bot)
+        self.club = self.bot.clubs.add(Club(self.bot, CST.DEFAULT_CLUB_NAME, 1, 2, 3))
+        self.club.routinesTriggerTime = datetime.time(8)
+        self.routine = self.create_routine("monday_training_poll")
+
+    def create_routine(self, name):
+        routine = poll.TrainingPollRoutine(name, name, self.bot, None, "lu")
+        self.club.add_routine(routine)
+        routine.enable(MONDAY, self.club.trainingPollsChannelId)
+        return routine
+
+    def test_restart_on_trigger_day(self):
+        # Executed this morning, then the bot restarts and the trigger time is moved later.
+        self.routine.lastExecutionDate = local_date(2026, 10, 19, 8, 0, 5)
+        self.routine.set_trigger_time(datetime.time(20))
+        self.assertEqual(self.routine.get_next_execution_date(local_date(2026, 10, 19, 12)),
+                         local_date(2026, 10, 26, 20))
+        # Not executed yet today.
+        self.routine.lastExecutionDate = local_date(2026, 10, 12, 8, 0, 5)
+        self.assertEqual(self.routine.get_next_execution_date(local_date(2026, 10, 19, 12)),
+                         local_date(2026, 10, 19, 20))
+
+    def test_restart_right_after_execution(self):
+        self.routine.lastExecutionDate = local_date(2026, 10, 19, 8, 0, 5)
+        self.assertEqual(self.routine.get_next_execution_date(local_date(2026, 10, 19, 8, 0, 10)),
+                         local_date(2026, 10, 26, 8))
+
+    def test_disabled(self):
+        self.routine.disable()
+        self.assertIsNone(self.routine.get_next_execution_date(local_date(2026, 10, 19, 7)))
+        self.assertEqual(self.bot.scheduler.upcoming(), [])
+
+    def test_upcoming(self):
+        other = self.create_routine("other_monday_training_poll")
+        now = local_date(2026, 10, 19, 7)
+        other.set_trigger_time(datetime.time(7, 30))
+        for routine in (self.routine, other):
+            self.bot.scheduler.schedule(routine, now)
+        self.assertEqual(self.bot.scheduler.upcoming(), [(local_date(2026, 10, 19, 7, 30), other),
+                                                         (local_date(2026, 10, 19, 8), self.routine)])
+        # The routines' previous entries are left in the heap, outdated.
+        self.assertEqual(len(self.bot.scheduler.entries), 2)
+        self.assertGreater(len(self.bot.scheduler.heap), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()